@@ -0,0 +1,84 @@
+"""Compare sorting whole cost breakdowns with selecting only the rendered rows.
+
+Usage: python benchmarks/aggregation_benchmark.py [rows] [groups] [limit] [runs]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from costemailer.aggregation import get_totals  # noqa: E402
+from costemailer.aggregation import order_values  # noqa: E402
+
+
+def get_synthetic_values(rows, groups, seed=0):
+    rand = random.Random(seed)
+    return [
+        {
+            "account": f"acct-{index}",
+            "account_alias": f"acct-{index}",
+            "org_unit_id": f"ou-{rand.randrange(groups)}",
+            "cost": {"total": {"value": round(rand.uniform(1, 1000), 2), "units": "USD"}},
+            "delta_value": round(rand.uniform(-100, 100), 2),
+        }
+        for index in range(rows)
+    ]
+
+
+def group_values(values):
+    groups = {}
+    for value in values:
+        groups.setdefault(value["org_unit_id"], []).append(value)
+    return groups
+
+
+def sort_aggregate(values, cost_order, limit):
+    """Aggregation the way the reports did it before the render limits, sorting every list."""
+    total, delta = get_totals(values)
+    if cost_order == "delta":
+        breakdown = sorted(values, key=lambda i: i["delta_value"], reverse=True)
+    else:
+        breakdown = sorted(values, key=lambda i: i["cost"]["total"]["value"], reverse=True)
+    groups = group_values(values)
+    for group, group_list in groups.items():
+        if cost_order == "delta":
+            groups[group] = sorted(group_list, key=lambda i: i["delta_value"], reverse=True)
+        else:
+            groups[group] = sorted(group_list, key=lambda i: i["cost"]["total"]["value"], reverse=True)
+    return total, delta, breakdown[:limit], {group: group_list[:limit] for group, group_list in groups.items()}
+
+
+def select_aggregate(values, cost_order, limit):
+    total, delta = get_totals(values)
+    breakdown = order_values(values, cost_order, limit=limit)
+    groups = {
+        group: order_values(group_list, cost_order, limit=limit) for group, group_list in group_values(values).items()
+    }
+    return total, delta, breakdown, groups
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    groups = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    limit = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    runs = int(sys.argv[4]) if len(sys.argv) > 4 else 5
+    values = get_synthetic_values(rows, groups)
+
+    assert sort_aggregate(values, "cost", limit) == select_aggregate(values, "cost", limit)
+
+    for name, aggregate in (("sort", sort_aggregate), ("select", select_aggregate)):
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            aggregate(values, "cost", limit)
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{name}: rows={rows}, groups={groups}, limit={limit},"
+            f" best={min(timings) * 1000:.1f}ms, mean={sum(timings) / runs * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare per-chart time and peak RSS of the chart renderers.
+
+Usage: python benchmarks/chart_benchmark.py [charts] [days]
+
+Each renderer runs in its own process so the peak RSS of one does not
+hide the other.
+"""
+import io
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def get_daily_data(days):
+    return [
+        {
+            "date": f"2024-01-{day + 1:02}",
+            "values": [
+                {"date": f"2024-01-{day + 1:02}", "cost": {"total": {"value": 100.0 + day * 3.5, "units": "USD"}}}
+            ],
+        }
+        for day in range(days)
+    ]
+
+
+def pandas_plot_data(data):
+    """Chart drawn the way plot_data did before the object oriented renderer."""
+    import matplotlib.pyplot as plt  # noqa: F401
+    import pandas as pd
+
+    from costemailer.charting import get_chart_values
+
+    dates, costs, units = get_chart_values(data)
+    df = pd.DataFrame({"Dates": dates, units: costs}, index=dates)
+    image = io.BytesIO()
+    bar = df[units].plot.bar(title="Daily Cost", x="Dates", xlabel="Dates", y=units, ylabel=units)
+    fig = bar.get_figure()
+    fig.savefig(image, format="png")
+    fig.clf()
+    return image.getvalue()
+
+
+def run_renderer(renderer, charts, days):
+    if renderer == "pandas":
+        import matplotlib
+
+        matplotlib.use("Agg")
+        plot = pandas_plot_data
+    else:
+        from costemailer.charting import plot_data as plot
+        from costemailer.config import Config
+
+        # Every chart is identical, measure drawing rather than cache hits.
+        Config.CHART_CACHE = False
+
+    data = get_daily_data(days)
+    start = time.perf_counter()
+    for _ in range(charts):
+        plot(data)
+    elapsed = time.perf_counter() - start
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{renderer}: charts={charts}, per_chart={elapsed / charts * 1000:.1f}ms, peak_rss={peak_rss:.1f}MiB")
+
+
+def main():
+    charts = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 31
+    for renderer in ("pandas", "figure"):
+        subprocess.run([sys.executable, __file__, "--run", renderer, str(charts), str(days)], check=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--run":
+        run_renderer(sys.argv[2], int(sys.argv[3]), int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,205 @@
+"""Compare the original and the tree-indexed AWS org-unit cost rollup on a synthetic org-unit tree.
+
+The original rollup is kept here as it was before the tree index. Both must
+agree on the level of every org unit, which is also pinned for a 3-deep tree.
+
+Usage: python benchmarks/ou_rollup_benchmark.py [accounts] [org_units] [runs]
+"""
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from costemailer.orgunits import OrgUnitIndex  # noqa: E402
+from costemailer.reporting.aws import build_ou_report  # noqa: E402
+
+
+def get_synthetic_tree(accounts, org_units, seed=0):
+    """Build org units under a single root, each attached to a random earlier org unit, and account costs."""
+    rand = random.Random(seed)
+    org_units_data = [{"org_unit_id": "r", "org_unit_name": "Root", "sub_orgs": [], "accounts": []}]
+    for index in range(1, org_units):
+        parent = org_units_data[rand.randrange(max(1, index // 2), index) if index > 1 else 0]
+        org_unit = {"org_unit_id": f"ou-{index}", "org_unit_name": f"OU {index}", "sub_orgs": [], "accounts": []}
+        parent["sub_orgs"].append(org_unit["org_unit_id"])
+        org_units_data.append(org_unit)
+
+    accounts_data = []
+    for index in range(accounts):
+        account = f"acct-{index}"
+        rand.choice(org_units_data)["accounts"].append(account)
+        accounts_data.append(
+            get_account_data(account, round(rand.uniform(1, 1000), 2), round(rand.uniform(-100, 100), 2))
+        )
+    return org_units_data, {"data": [{"accounts": accounts_data}]}
+
+
+def get_account_data(account, cost, delta):
+    return {
+        "account": account,
+        "values": [
+            {
+                "account": account,
+                "account_alias": account,
+                "cost": {"total": {"value": cost, "units": "USD"}},
+                "delta_value": delta,
+            }
+        ],
+    }
+
+
+def build_org_units(org_units_data):
+    org_units = {}
+    aws_accounts_in_ou = {}
+    for org in org_units_data:
+        org = dict(org)
+        org_units[org["org_unit_id"]] = org
+        for account in org.get("accounts", []):
+            aws_accounts_in_ou[account] = org["org_unit_id"]
+    for org_unit_id, org in org_units.items():
+        for sub_org in org.get("sub_orgs", []):
+            org_units.get(sub_org, {})["parent_org"] = org_unit_id
+    return org_units, aws_accounts_in_ou
+
+
+def baseline_get_org_level(parent_org, aws_orgs_access, all_aws_orgs):
+    org_level = 0
+    if not parent_org or parent_org in aws_orgs_access:
+        return org_level
+    next_parent = all_aws_orgs.get(parent_org, {}).get("parent_org")
+    if next_parent:
+        org_level = 1 + baseline_get_org_level(next_parent, aws_orgs_access, all_aws_orgs)
+    return org_level
+
+
+def baseline_construct_parent_org(parent_org, aws_orgs_access, all_aws_orgs, org_values):
+    parent_org_dict = all_aws_orgs.get(parent_org, {})
+    if not parent_org_dict:
+        return None
+    next_parent = parent_org_dict.get("parent_org")
+    level = 0
+    if parent_org in aws_orgs_access:
+        next_parent = None
+    else:
+        level = 1 + baseline_get_org_level(next_parent, aws_orgs_access, all_aws_orgs)
+    org_values[parent_org] = {
+        "org_unit_id": parent_org,
+        "org_unit_name": parent_org_dict.get("org_unit_name"),
+        "parent_org": parent_org_dict.get("parent_org"),
+        "level": level,
+        "cost": 0,
+        "delta": 0,
+    }
+    return next_parent
+
+
+def baseline_rollup(monthly_costs, org_units, aws_accounts_in_ou, aws_orgs_access, cost_order):
+    """The org-unit rollup of build_ou_report before the tree index, returns the org values."""
+    org_values = {}
+    orgs_in_ous = {}
+    for acct_data in monthly_costs["data"][0]["accounts"]:
+        acct_datum = acct_data["values"][0]
+        cost = acct_datum["cost"]["total"]["value"]
+        delta = acct_datum["delta_value"]
+        cur_org_unit_id = aws_accounts_in_ou.get(acct_datum["account_alias"])
+        aws_org = org_units.get(cur_org_unit_id, {}) if cur_org_unit_id else {}
+        if not aws_org:
+            continue
+        parent_org_id = aws_org.get("parent_org")
+        org_level = 0
+        if cur_org_unit_id not in aws_orgs_access:
+            org_level = 1 + baseline_get_org_level(parent_org_id, aws_orgs_access, org_units)
+        org_dict = {
+            "org_unit_id": cur_org_unit_id,
+            "org_unit_name": aws_org.get("org_unit_name"),
+            "parent_org": parent_org_id,
+            "level": org_level,
+            "cost": cost,
+            "delta": delta,
+        }
+        if cur_org_unit_id in org_values:
+            org_dict["cost"] += org_values[cur_org_unit_id]["cost"]
+            org_dict["delta"] += org_values[cur_org_unit_id]["delta"]
+        org_values[cur_org_unit_id] = org_dict
+        if cur_org_unit_id not in aws_orgs_access:
+            parent_org = parent_org_id
+            while parent_org:
+                parent_org = baseline_construct_parent_org(parent_org, aws_orgs_access, org_units, org_values)
+
+    for level in range(5, -1, -1):
+        for org in [org for org in org_values.values() if org["level"] == level]:
+            parent_org_dict = org_values.get(org["parent_org"])
+            if parent_org_dict:
+                parent_org_dict["cost"] += org["cost"]
+                parent_org_dict["delta"] += org["delta"]
+                orgs_in_ous.setdefault(org["parent_org"], []).append(org)
+    for org_unit_id, org_list in orgs_in_ous.items():
+        orgs_in_ous[org_unit_id] = sorted(org_list, key=lambda i: i[cost_order], reverse=True)
+    return sorted(org_values.values(), key=lambda i: i[cost_order], reverse=True)
+
+
+def get_levels(org_list):
+    return {org["org_unit_id"]: org["level"] for org in org_list}
+
+
+def rollup(monthly_costs, org_index, aws_orgs_access, org_level_limit=100):
+    with contextlib.redirect_stdout(io.StringIO()):
+        template_variables, _ = build_ou_report(
+            monthly_costs, org_index, [], aws_orgs_access, "cost", org_level_limit, 300, "2024-01", {"units": "USD"}
+        )
+    return template_variables["aws_org_unit_list"]
+
+
+def check_levels():
+    """Pin the levels of a root, child and grandchild org unit each holding an account."""
+    org_units_data = [
+        {"org_unit_id": "r", "org_unit_name": "Root", "sub_orgs": ["a"], "accounts": ["acct-r"]},
+        {"org_unit_id": "a", "org_unit_name": "A", "sub_orgs": ["b"], "accounts": ["acct-a"]},
+        {"org_unit_id": "b", "org_unit_name": "B", "sub_orgs": [], "accounts": ["acct-b"]},
+    ]
+    monthly_costs = {"data": [{"accounts": [get_account_data(f"acct-{org}", 1, 0) for org in "rab"]}]}
+    org_index = OrgUnitIndex(org_units_data)
+    org_units, aws_accounts_in_ou = build_org_units(org_units_data)
+    for access, expected in (([], {"r": 1, "a": 1, "b": 2}), (["a"], {"r": 1, "a": 0, "b": 1})):
+        levels = get_levels(rollup(monthly_costs, org_index, access))
+        assert levels == expected, (access, levels)
+        assert get_levels(baseline_rollup(monthly_costs, org_units, aws_accounts_in_ou, access, "cost")) == expected
+    assert get_levels(rollup(monthly_costs, org_index, [], org_level_limit=1)) == {"r": 1, "a": 1}
+
+
+def main():
+    accounts = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    org_unit_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    runs = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    check_levels()
+    org_units_data, monthly_costs = get_synthetic_tree(accounts, org_unit_count)
+    org_index = OrgUnitIndex(org_units_data)
+    org_units, aws_accounts_in_ou = build_org_units(org_units_data)
+    depth = max(org_index.get_depth(org["org_unit_id"]) for org in org_units_data)
+
+    assert get_levels(rollup(monthly_costs, org_index, [])) == get_levels(
+        baseline_rollup(monthly_costs, org_units, aws_accounts_in_ou, [], "cost")
+    )
+
+    implementations = (
+        ("baseline", lambda: baseline_rollup(monthly_costs, org_units, aws_accounts_in_ou, [], "cost")),
+        ("indexed", lambda: rollup(monthly_costs, org_index, [])),
+    )
+    for name, implementation in implementations:
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            implementation()
+            timings.append(time.perf_counter() - start)
+        print(
+            f"{name}: accounts={accounts}, org_units={org_unit_count}, depth={depth},"
+            f" best={min(timings) * 1000:.1f}ms, mean={sum(timings) / runs * 1000:.1f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
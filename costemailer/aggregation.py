@@ -0,0 +1,52 @@
+"""Totals and ordering of the cost breakdowns returned by the cost management API.
+
+Breakdowns are ordered by descending cost or delta, ties keeping the order of
+the API response as sorted(..., reverse=True) does. Reports only render the
+first rows of a breakdown up to their limits, so with a limit only those rows
+are selected with heapq.nlargest instead of sorting the whole breakdown.
+"""
+import heapq
+from operator import itemgetter
+
+
+VALUE_KEYS = {
+    "cost": lambda value: value["cost"]["total"]["value"],
+    "delta": lambda value: value["delta_value"],
+}
+
+
+def get_breakdown_values(groups):
+    """Obtain the first values entry of each group of a breakdown."""
+    return [(group.get("values") or [{}])[0] for group in groups]
+
+
+def get_totals(values):
+    """Obtain the total cost and delta of breakdown values."""
+    cost = 0
+    delta = 0
+    for value in values:
+        cost += value["cost"]["total"]["value"]
+        delta += value["delta_value"]
+    return cost, delta
+
+
+def _order(items, key, limit=None):
+    if limit is not None and limit < len(items):
+        return heapq.nlargest(limit, items, key=key)
+    return sorted(items, key=key, reverse=True)
+
+
+def order_values(values, cost_order, limit=None):
+    """Order breakdown values by descending cost or delta.
+
+    With a limit only the first limit values are selected and ordered.
+    """
+    return _order(values, VALUE_KEYS["delta" if cost_order == "delta" else "cost"], limit)
+
+
+def order_records(records, cost_order, limit=None):
+    """Order dicts holding cost and delta by descending cost or delta.
+
+    With a limit only the first limit dicts are selected and ordered.
+    """
+    return _order(records, itemgetter("delta" if cost_order == "delta" else "cost"), limit)
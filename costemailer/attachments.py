@@ -0,0 +1,96 @@
+"""In-memory CSV attachments, compressed when configured or when they grow large."""
+import csv
+import gzip
+import io
+import zipfile
+
+from .config import Config
+
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zip": ".zip"}
+# zip opens natively in most mail clients, so it is used when an attachment outgrows the threshold.
+AUTO_COMPRESSION = "zip"
+DISABLED_COMPRESSION = ("", "none")
+
+_UNSUPPORTED_WARNED = set()
+
+
+def get_compression(compression):
+    """Obtain the supported compression named by compression, None when disabled.
+
+    Unsupported names are logged once and treated as disabled.
+    """
+    compression = (compression or "").strip().lower()
+    if compression in DISABLED_COMPRESSION:
+        return None
+    if compression not in COMPRESSION_SUFFIXES:
+        if compression not in _UNSUPPORTED_WARNED:
+            _UNSUPPORTED_WARNED.add(compression)
+            print(f"Unsupported CSV compression {compression}, attaching CSV files uncompressed.")
+        return None
+    return compression
+
+
+class CSVAttachment:
+    """CSV file written row by row into memory.
+
+    Report builders pass their rows as generators, so each row dict only exists
+    while it is written rather than the whole CSV being held as a list first.
+
+    Rows are compressed as they are written when compression is gzip or zip.
+    Without compression the attachment switches to AUTO_COMPRESSION once it
+    grows past threshold bytes.
+    """
+
+    def __init__(self, file_name, compression=None, threshold=None):
+        self.file_name = file_name
+        self.compression = get_compression(Config.CSV_COMPRESSION if compression is None else compression)
+        self.threshold = Config.CSV_COMPRESSION_THRESHOLD if threshold is None else threshold
+        self.size = 0
+        self._text = io.StringIO()
+        self._buffer = None
+        self._archive = None
+        self._stream = None
+        if self.compression:
+            self._open(self.compression)
+
+    def _open(self, compression):
+        self.compression = compression
+        self._buffer = io.BytesIO()
+        if compression == "gzip":
+            self._stream = gzip.GzipFile(filename=self.file_name, mode="wb", fileobj=self._buffer, mtime=0)
+        else:
+            self._archive = zipfile.ZipFile(self._buffer, "w", compression=zipfile.ZIP_DEFLATED)
+            self._stream = self._archive.open(self.file_name, "w")
+
+    def write(self, text):
+        data = text.encode("utf-8")
+        self.size += len(data)
+        if self._stream is not None:
+            self._stream.write(data)
+            return
+        self._text.write(text)
+        if self.threshold and self.size > self.threshold:
+            written = self._text.getvalue()
+            self._text = None
+            self._open(AUTO_COMPRESSION)
+            self._stream.write(written.encode("utf-8"))
+
+    def close(self):
+        """Finish the attachment, returns its (file name, content) tuple."""
+        if self._stream is None:
+            return (self.file_name, self._text.getvalue())
+        self._stream.close()
+        if self._archive is not None:
+            self._archive.close()
+        return (self.file_name + COMPRESSION_SUFFIXES[self.compression], self._buffer.getvalue())
+
+
+def write_csv_attachment(file_name, fieldnames, rows, compression=None, threshold=None):
+    """Write the rows into a CSV attachment, returns its (file name, content) tuple."""
+    attachment = CSVAttachment(file_name, compression=compression, threshold=threshold)
+    writer = csv.DictWriter(attachment, fieldnames=fieldnames)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+    return attachment.close()
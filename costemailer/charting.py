@@ -1,18 +1,41 @@
-import os
-import tempfile
+import hashlib
+import io
+import json
+import threading
 
-import matplotlib.pyplot as plt
-import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
+from .config import Config
 
-def plot_data(data):
+
+BAR_WIDTH = 0.5
+BAR_COLOR = "#1f77b4"
+CHART_STYLE = {"title": "Daily Cost", "xlabel": "Dates", "bar_width": BAR_WIDTH, "bar_color": BAR_COLOR}
+
+# Every report draws on the same axes, only one chart is drawn at a time.
+_PLOT_LOCK = threading.Lock()
+_AXES = {}
+_CHART_CACHE = {}
+_CHART_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _get_axes():
+    if "axes" not in _AXES:
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        axes = figure.add_subplot()
+        axes.set_title(CHART_STYLE["title"])
+        axes.set_xlabel(CHART_STYLE["xlabel"])
+        _AXES["axes"] = axes
+    return _AXES["axes"]
+
+
+def get_chart_values(data):
+    """Obtain the dates, daily costs and cost units of the daily cost data."""
     dates = []
     costs = []
     units = "USD"
-
-    if not data:
-        return (None, None)
-
     for datum in data:
         if (
             (datum.get("values") is not None)
@@ -27,11 +50,64 @@ def plot_data(data):
             units = "USD"
             dates.append(datum["date"])
             costs.append(0.0)
+    return dates, costs, units
+
+
+def draw_chart(axes, dates, costs, units):
+    """Draw the daily cost bars, replacing the bars of the previous chart.
+
+    The axes, their ticks and labels are kept between charts since creating
+    them is most of the cost of drawing a chart.
+    """
+    for container in list(axes.containers):
+        container.remove()
+    axes.relim()
+    positions = range(len(dates))
+    axes.bar(positions, costs, CHART_STYLE["bar_width"], color=CHART_STYLE["bar_color"])
+    axes.set_xlim(-0.5, len(dates) - 0.5)
+    axes.set_xticks(positions, dates, rotation=90)
+    axes.set_ylabel(units)
+
+
+def _chart_key(dates, costs, units):
+    """Hash the chart contents and style so identical charts share one image."""
+    content = json.dumps([dates, costs, units, CHART_STYLE], sort_keys=True, default=str)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def plot_data(data):
+    """Draw the daily cost chart, returns the PNG image bytes.
+
+    Charts of identical series are drawn once per run and shared when
+    CHART_CACHE is enabled.
+    """
+    if not data:
+        return None
+
+    dates, costs, units = get_chart_values(data)
+    key = _chart_key(dates, costs, units)
+    with _PLOT_LOCK:
+        if Config.CHART_CACHE and key in _CHART_CACHE:
+            _CHART_CACHE_STATS["hits"] += 1
+            return _CHART_CACHE[key]
+        _CHART_CACHE_STATS["misses"] += 1
+        image = io.BytesIO()
+        axes = _get_axes()
+        draw_chart(axes, dates, costs, units)
+        axes.figure.savefig(image, format="png")
+        if Config.CHART_CACHE:
+            _CHART_CACHE[key] = image.getvalue()
+    return image.getvalue()
+
+
+def get_chart_cache_stats():
+    """Obtain the chart cache hit/miss counts."""
+    with _PLOT_LOCK:
+        stats = dict(_CHART_CACHE_STATS)
+        stats["entries"] = len(_CHART_CACHE)
+    return stats
+
 
-    df = pd.DataFrame({"Dates": dates, units: costs}, index=dates)
-    bar = df[units].plot.bar(title="Daily Cost", x="Dates", xlabel="Dates", y=units, ylabel=units)
-    fig = bar.get_figure()
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
-    fig.savefig(tmp.name)
-    fig.clf()
-    return (tmp, tmp.name)
+def print_chart_cache_summary():
+    stats = get_chart_cache_stats()
+    print(f"Chart cache: hits={stats['hits']}, misses={stats['misses']}, entries={stats['entries']}")
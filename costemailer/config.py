@@ -26,16 +26,47 @@ class Config:
     )
     CLOUD_DOT_API_ROOT = os.getenv("CLOUD_DOT_API_ROOT", "https://console.redhat.com/api/")
 
+    TOKEN_REFRESH_MARGIN = float(os.getenv("TOKEN_REFRESH_MARGIN", "60"))
+
     IBM_CLOUD_API_KEY = os.getenv("IBM_CLOUD_API_KEY")
 
     COST_MGMT_RECIPIENTS = {}
     COST_MGMT_RECIPIENTS_FILE = os.getenv("COST_MGMT_RECIPIENTS_FILE", "/data/config.yaml")
     COST_MGMT_API_PREFIX = os.getenv("COST_MGMT_API_PREFIX", "cost-management/v1/")
+    COST_QUERY_CACHE = os.getenv("COST_QUERY_CACHE", "True").lower() in ("true", "1")
+    COST_QUERY_CONCURRENCY = int(os.getenv("COST_QUERY_CONCURRENCY", "8"))
+    AWS_COST_CENTER_CONCURRENCY = int(os.getenv("AWS_COST_CENTER_CONCURRENCY", "4"))
+    AWS_ORG_UNIT_PAGE_LIMIT = int(os.getenv("AWS_ORG_UNIT_PAGE_LIMIT", "1000"))
 
     RBAC_API_PREFIX = os.getenv("RBAC_API_PREFIX", "rbac/v1/")
+    RBAC_CONCURRENCY = int(os.getenv("RBAC_CONCURRENCY", "8"))
+    RBAC_TARGETED_LOOKUP = os.getenv("RBAC_TARGETED_LOOKUP", "True").lower() in ("true", "1")
+
+    HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+    HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+    HTTP_KEEP_ALIVE = os.getenv("HTTP_KEEP_ALIVE", "True").lower() in ("true", "1")
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "300"))
+
+    RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+    RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1"))
+    RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "30"))
+    RETRY_BUDGET = int(os.getenv("RETRY_BUDGET", "100"))
+
+    REPORT_CONCURRENCY = int(os.getenv("REPORT_CONCURRENCY", "4"))
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+    TEMPLATE_BYTECODE_CACHE_DIR = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR")
+    CHART_CACHE = os.getenv("CHART_CACHE", "True").lower() in ("true", "1")
+    CSV_COMPRESSION = os.getenv("CSV_COMPRESSION", "")
+    CSV_COMPRESSION_THRESHOLD = int(os.getenv("CSV_COMPRESSION_THRESHOLD", str(5 * 1024 * 1024)))
 
     EMAIL_USER = os.getenv("EMAIL_USER")
     EMAIL_PASSWORD = os.getenv("EMAIL_PASSWORD")
+    SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+    EMAIL_RATE = float(os.getenv("EMAIL_RATE", "1"))
+    EMAIL_BURST = int(os.getenv("EMAIL_BURST", "5"))
+    EMAIL_SEND_ATTEMPTS = int(os.getenv("EMAIL_SEND_ATTEMPTS", "3"))
+    EMAIL_QUEUE_SIZE = int(os.getenv("EMAIL_QUEUE_SIZE", "20"))
 
     if os.path.exists(COST_MGMT_RECIPIENTS_FILE):
         with open(COST_MGMT_RECIPIENTS_FILE, "r") as stream:
@@ -1,9 +1,16 @@
-import time
-
-import requests
+import asyncio
+import contextvars
+import copy
+import threading
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
 
 from .config import Config
 from .rbac import get_rbac_credential_header
+from .rbac import invalidate_credentials
+from .retry import is_json_response
+from .retry import RetryPolicy
+from .session import get_session
 
 
 AWS_COST_ENDPOINT = "reports/aws/costs/"
@@ -17,24 +24,154 @@ CURRENT_MONTH_PARAMS = {"filter[time_scope_units]": "month", "filter[time_scope_
 CURRENT_COST_MONTH_PARAMS = {"filter[time_scope_units]": "month", "filter[time_scope_value]": "-1", "delta": "cost"}
 RECOMMENDATION_PARAMS = {"limit": 100, "offset": 0, "order_by": "cluster", "order_how": "desc"}
 
+_QUERY_CACHE = {}
+_QUERY_IN_FLIGHT = {}
+_QUERY_CACHE_LOCK = threading.Lock()
+_QUERY_CACHE_STATS = {"hits": 0, "misses": 0, "coalesced": 0}
+_QUERY_LIMIT = threading.BoundedSemaphore(Config.COST_QUERY_CONCURRENCY)
+_QUERY_LOOP = {}
+_QUERY_LOOP_LOCK = threading.Lock()
+_IN_QUERY = contextvars.ContextVar("in_cost_query", default=False)
+COST_API_RETRY = RetryPolicy()
+
+
+def _query_key(path, params):
+    """Normalize an endpoint and its params into a hashable cache key."""
+    items = []
+    for key, value in (params or {}).items():
+        if isinstance(value, (list, tuple)):
+            value = tuple(str(val) for val in value)
+        else:
+            value = str(value)
+        items.append((str(key), value))
+    return path.strip("/"), tuple(sorted(items))
+
 
-def get_cost_data(path="status/", params={}, retry_count=0):
-    """Obtain the response cost data."""
+def _request_cost_data(path, params):
+    """Request the cost data from the API."""
     api_call = Config.CLOUD_DOT_API_ROOT + Config.COST_MGMT_API_PREFIX + path
-    headers = get_rbac_credential_header()
 
-    if retry_count < 3:
-        response = requests.get(api_call, params=params, headers=headers)
+    def send_request():
+        headers = get_rbac_credential_header()
+        with _QUERY_LIMIT:
+            response = get_session().get(api_call, params=params, headers=headers)
         print(f"path={path}, params={params}, response.status_code={response.status_code}")
-        if (
-            response.status_code >= 200
-            and response.status_code < 300
-            and "application/json" in response.headers["content-type"]
-        ):
-            return response.json()
-        else:
-            print(response.text)
-            time.sleep(30)
-            return get_cost_data(path, params, retry_count=retry_count + 1)
+        return response
 
+    response = COST_API_RETRY.send(send_request, refresh_credentials=invalidate_credentials)
+    if is_json_response(response):
+        return response.json()
+
+    print(response.text)
     return {}
+
+
+def get_cost_data(path="status/", params={}):
+    """Obtain the response cost data.
+
+    Each distinct query is sent to the API once per run; repeated queries are
+    answered from the cache and concurrent identical queries wait on the
+    request already in flight. Failed responses are not cached.
+    """
+    if not Config.COST_QUERY_CACHE:
+        return _request_cost_data(path, params)
+
+    key = _query_key(path, params)
+    with _QUERY_CACHE_LOCK:
+        if key in _QUERY_CACHE:
+            _QUERY_CACHE_STATS["hits"] += 1
+            return copy.deepcopy(_QUERY_CACHE[key])
+        future = _QUERY_IN_FLIGHT.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _QUERY_IN_FLIGHT[key] = future
+            _QUERY_CACHE_STATS["misses"] += 1
+        else:
+            _QUERY_CACHE_STATS["coalesced"] += 1
+
+    if is_owner:
+        try:
+            result = _request_cost_data(path, params)
+        except Exception as err:
+            with _QUERY_CACHE_LOCK:
+                del _QUERY_IN_FLIGHT[key]
+            future.set_exception(err)
+            raise
+        with _QUERY_CACHE_LOCK:
+            if result:
+                _QUERY_CACHE[key] = result
+            del _QUERY_IN_FLIGHT[key]
+        future.set_result(result)
+
+    return copy.deepcopy(future.result())
+
+
+async def get_cost_data_async(path="status/", params={}):
+    """Obtain the response cost data without blocking the event loop.
+
+    Requests run on worker threads sharing the pooled session and the query
+    cache, and at most COST_QUERY_CONCURRENCY requests are in flight at once
+    across all reports.
+    """
+    return await asyncio.to_thread(get_cost_data, path, params)
+
+
+def _get_query_loop():
+    """Obtain the event loop gathering the cost queries of the run, started on first use.
+
+    The loop runs on a daemon thread of its own and hands blocking queries to
+    one pool of COST_QUERY_CONCURRENCY threads shared by every report.
+    """
+    with _QUERY_LOOP_LOCK:
+        if "loop" not in _QUERY_LOOP:
+            loop = asyncio.new_event_loop()
+            loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=Config.COST_QUERY_CONCURRENCY, thread_name_prefix="cost-query")
+            )
+            threading.Thread(target=loop.run_forever, name="cost-query-loop", daemon=True).start()
+            _QUERY_LOOP["loop"] = loop
+        return _QUERY_LOOP["loop"]
+
+
+async def _gather_queries(queries, concurrency):
+    semaphore = asyncio.Semaphore(concurrency or Config.COST_QUERY_CONCURRENCY)
+
+    async def run_query(query):
+        async with semaphore:
+            return await query
+
+    return await asyncio.gather(*(run_query(query) for query in queries))
+
+
+def run_queries(*queries, concurrency=None):
+    """Run cost query coroutines concurrently and return their results in order.
+
+    The queries are gathered on the event loop shared by the run, at most
+    concurrency of them at once (COST_QUERY_CONCURRENCY by default), in the
+    context of the caller so their output stays with its report. Queries
+    that call run_queries themselves run the nested queries on a loop of
+    their own in the calling thread instead of waiting on the shared pool.
+    """
+    if _IN_QUERY.get():
+        return asyncio.run(_gather_queries(queries, concurrency))
+    context = contextvars.copy_context()
+    context.run(_IN_QUERY.set, True)
+    future = context.run(asyncio.run_coroutine_threadsafe, _gather_queries(queries, concurrency), _get_query_loop())
+    return future.result()
+
+
+def get_query_cache_stats():
+    """Obtain the cost query cache hit/miss counts."""
+    with _QUERY_CACHE_LOCK:
+        stats = dict(_QUERY_CACHE_STATS)
+        stats["entries"] = len(_QUERY_CACHE)
+    return stats
+
+
+def print_query_cache_summary():
+    stats = get_query_cache_stats()
+    print(
+        f"Cost query cache: hits={stats['hits']}, misses={stats['misses']},"
+        f" coalesced={stats['coalesced']}, entries={stats['entries']}"
+    )
@@ -0,0 +1,147 @@
+"""AWS organizational unit hierarchy, fetched once on first use."""
+import threading
+
+from .config import Config
+from .costquerier import AWS_ORG_UNIT_ENDPOINT
+from .costquerier import CURRENT_MONTH_PARAMS
+from .costquerier import get_cost_data
+
+
+_ORG_UNITS = {}
+_ORG_UNITS_LOCK = threading.Lock()
+
+
+def get_org_unit_pages(limit=None):
+    """Obtain every org unit, following the offset pagination of the API."""
+    limit = limit or Config.AWS_ORG_UNIT_PAGE_LIMIT
+    params = CURRENT_MONTH_PARAMS.copy()
+    params["limit"] = str(limit)
+    org_units_data = []
+    while True:
+        response = get_cost_data(path=AWS_ORG_UNIT_ENDPOINT, params=params)
+        page = response.get("data", [])
+        org_units_data.extend(page)
+        count = response.get("meta", {}).get("count")
+        if not page or len(page) < limit or (count is not None and len(org_units_data) >= count):
+            return org_units_data
+        params = params.copy()
+        params["offset"] = str(len(org_units_data))
+
+
+class OrgUnitIndex:
+    """Read-only index of the org-unit hierarchy answering lookups in constant time.
+
+    Org units are numbered in depth-first order so the subtree of an org unit
+    is a contiguous range: membership is a range check and the accounts below
+    an org unit are a slice of the accounts sorted in that order.
+    """
+
+    def __init__(self, org_units_data):
+        names = {}
+        parents = {}
+        children = {}
+        direct_accounts = {}
+        for org in org_units_data:
+            org_unit_id = org.get("org_unit_id")
+            names[org_unit_id] = org.get("org_unit_name")
+            parents.setdefault(org_unit_id, None)
+            direct_accounts[org_unit_id] = list(org.get("accounts", []))
+            children[org_unit_id] = list(org.get("sub_orgs", []))
+        for org_unit_id, sub_orgs in children.items():
+            for sub_org in sub_orgs:
+                if sub_org in parents:
+                    parents[sub_org] = org_unit_id
+
+        order = {}
+        end = {}
+        depths = {}
+        ancestors = {}
+        accounts = []
+        account_org_units = {}
+        account_start = {}
+        account_end = {}
+        roots = [org_unit_id for org_unit_id, parent_org in parents.items() if parent_org is None]
+        # Org units caught in a parent cycle are not below any root, start from them afterwards.
+        for root in roots + list(parents):
+            if root in order:
+                continue
+            stack = [(root, None, False)]
+            while stack:
+                org_unit_id, parent_org, visited = stack.pop()
+                if visited:
+                    end[org_unit_id] = len(order)
+                    account_end[org_unit_id] = len(accounts)
+                    continue
+                if org_unit_id in order:
+                    continue
+                order[org_unit_id] = len(order)
+                depths[org_unit_id] = depths[parent_org] + 1 if parent_org is not None else 0
+                ancestors[org_unit_id] = (parent_org,) + ancestors[parent_org] if parent_org is not None else ()
+                account_start[org_unit_id] = len(accounts)
+                for account in direct_accounts[org_unit_id]:
+                    accounts.append(account)
+                    account_org_units[account] = org_unit_id
+                stack.append((org_unit_id, parent_org, True))
+                for child in reversed(children[org_unit_id]):
+                    if child in parents and child not in order:
+                        stack.append((child, org_unit_id, False))
+
+        self._names = names
+        self._parents = parents
+        self._order = order
+        self._end = end
+        self._depths = depths
+        self._ancestors = ancestors
+        self._accounts = tuple(accounts)
+        self._account_org_units = account_org_units
+        self._account_start = account_start
+        self._account_end = account_end
+
+    def __contains__(self, org_unit_id):
+        return org_unit_id in self._order
+
+    def __len__(self):
+        return len(self._order)
+
+    def get_name(self, org_unit_id):
+        return self._names.get(org_unit_id)
+
+    def get_parent(self, org_unit_id):
+        return self._parents.get(org_unit_id)
+
+    def get_depth(self, org_unit_id):
+        """Obtain the depth of the org unit, root org units are at depth 0."""
+        return self._depths.get(org_unit_id)
+
+    def get_ancestors(self, org_unit_id):
+        """Obtain the ancestors of the org unit, nearest first."""
+        return self._ancestors.get(org_unit_id, ())
+
+    def get_account_org_unit(self, account):
+        """Obtain the org unit directly holding the account."""
+        return self._account_org_units.get(account)
+
+    def is_in_subtree(self, org_unit_id, root_org_unit_id):
+        """Determine if the org unit is the root org unit or one of its descendants."""
+        if org_unit_id not in self._order or root_org_unit_id not in self._order:
+            return False
+        return self._order[root_org_unit_id] <= self._order[org_unit_id] < self._end[root_org_unit_id]
+
+    def get_descendant_accounts(self, org_unit_id):
+        """Obtain the accounts held by the org unit and every org unit below it."""
+        if org_unit_id not in self._order:
+            return ()
+        return self._accounts[self._account_start[org_unit_id] : self._account_end[org_unit_id]]
+
+
+def get_org_unit_index():
+    """Obtain the org-unit index, fetching the hierarchy on the first call only.
+
+    Reports that never use org units do not query them at all.
+    """
+    with _ORG_UNITS_LOCK:
+        if "index" not in _ORG_UNITS:
+            org_units_data = get_org_unit_pages()
+            print(f"Loaded {len(org_units_data)} AWS org units.")
+            _ORG_UNITS["index"] = OrgUnitIndex(org_units_data)
+        return _ORG_UNITS["index"]
@@ -1,12 +1,21 @@
 import base64
-
-import requests
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
 
 from .config import Config
+from .retry import is_json_response
+from .retry import RetryPolicy
+from .session import get_session
+from .tokencache import TokenCache
 
 
 USER_ENDPONT = "principals/"
 ACCESS_ENDPOINT = "access/"
+PAGE_LIMIT = 100
+USERNAME_BATCH_SIZE = 50
 
 AWS_ACCOUNT_ACCESS = "cost-management:aws.account:read"
 AWS_ORG_ACCESS = "cost-management:aws.organizational_unit:read"
@@ -15,17 +24,41 @@ OPENSHIFT_PROJECT_ACCESS = "cost-management:openshift.project:read"
 AZURE_SUBSCRIPTION_ID_ACCESS = "cost-management:azure.subscription_guid:read"
 GCP_ACCOUNT_ACCESS = "cost-management:gcp.account:read"
 
+RBAC_API_RETRY = RetryPolicy()
+_RBAC_LIMIT = threading.BoundedSemaphore(Config.RBAC_CONCURRENCY)
+# Per-user lookups and the page fetches they wait on run on separate pools,
+# so a lookup never holds a worker its own pages need.
+_RBAC_EXECUTOR = ThreadPoolExecutor(max_workers=Config.RBAC_CONCURRENCY, thread_name_prefix="rbac")
+_RBAC_PAGE_EXECUTOR = ThreadPoolExecutor(max_workers=Config.RBAC_CONCURRENCY, thread_name_prefix="rbac-page")
 
-def get_service_account_token():
+
+class RBACPageError(Exception):
+    """A page of an RBAC list endpoint could not be obtained."""
+
+
+def _request_service_account_token():
     payload = {
         "client_id": Config.CLOUD_DOT_SERVICE_ACCOUNT_ID,
         "client_secret": Config.CLOUD_DOT_SERVICE_ACCOUNT_SECRET,
         "grant_type": "client_credentials",
         "scope": "api.console api.iam.service_accounts",
     }
-    response = requests.post(Config.CLOUD_DOT_SERVICE_ACCOUNT_URL, data=payload)
+    response = RBAC_API_RETRY.send(lambda: get_session().post(Config.CLOUD_DOT_SERVICE_ACCOUNT_URL, data=payload))
     response_json = response.json()
-    return response_json.get("access_token")
+    return response_json.get("access_token"), response_json.get("expires_in")
+
+
+SERVICE_ACCOUNT_TOKEN = TokenCache(_request_service_account_token)
+
+
+def get_service_account_token():
+    """Obtain the service account token, reusing it until shortly before expiry."""
+    return SERVICE_ACCOUNT_TOKEN.get()
+
+
+def invalidate_credentials():
+    """Discard the cached service account token."""
+    SERVICE_ACCOUNT_TOKEN.invalidate()
 
 
 def get_rbac_credential_header():
@@ -40,33 +73,141 @@ def get_rbac_credential_header():
 
 
 def get_rbac_data(path="status/", params={}):
-    """Obtain the response rbac data."""
+    """Obtain the response rbac data.
+
+    At most RBAC_CONCURRENCY requests are in flight at once across all callers.
+    """
     api_call = Config.CLOUD_DOT_API_ROOT + Config.RBAC_API_PREFIX + path
-    headers = get_rbac_credential_header()
-    response = requests.get(api_call, params=params, headers=headers)
-
-    if (
-        response.status_code >= 200
-        and response.status_code < 300
-        and "application/json" in response.headers["content-type"]
-    ):
+
+    def send_request():
+        headers = get_rbac_credential_header()
+        with _RBAC_LIMIT:
+            return get_session().get(api_call, params=params, headers=headers)
+
+    response = RBAC_API_RETRY.send(send_request, refresh_credentials=invalidate_credentials)
+
+    if is_json_response(response):
         return response.json()
 
     return {}
 
 
+def _get_rbac_page(path, params):
+    """Obtain a page of an RBAC list endpoint.
+
+    Raises RBACPageError when the page still fails after the retries, as
+    skipping it would silently drop the principals or access it holds.
+    """
+    response = get_rbac_data(path=path, params=params)
+    if "data" not in response:
+        raise RBACPageError(f"Failed to obtain RBAC page path={path}, params={params}.")
+    return response
+
+
+def _get_page(path, params, offset, limit):
+    page_params = params.copy()
+    page_params["limit"] = str(limit)
+    page_params["offset"] = str(offset)
+    return _get_rbac_page(path, page_params)
+
+
+def iter_rbac_pages(path, params={}, limit=PAGE_LIMIT):
+    """Yield the data of every page of an RBAC list endpoint.
+
+    Once the first page reports the total count the remaining pages are
+    fetched concurrently; otherwise the links.next chain is followed. A page
+    that cannot be obtained raises RBACPageError.
+    """
+    response = _get_page(path, params, 0, limit)
+    yield response.get("data", [])
+
+    count = response.get("meta", {}).get("count")
+    if count is not None:
+        offsets = range(limit, int(count), limit)
+        if not offsets:
+            return
+        for page in _RBAC_PAGE_EXECUTOR.map(lambda offset: _get_page(path, params, offset, limit), offsets):
+            yield page.get("data", [])
+        return
+
+    next_link = response.get("links", {}).get("next")
+    while next_link and response.get("data"):
+        page_params = params.copy()
+        page_params.update({key: values[-1] for key, values in parse_qs(urlparse(next_link).query).items()})
+        response = _get_rbac_page(path, page_params)
+        yield response.get("data", [])
+        next_link = response.get("links", {}).get("next")
+
+
+def get_rbac_list(path, params={}):
+    """Obtain all items of a paginated RBAC list endpoint."""
+    items = []
+    for page in iter_rbac_pages(path, params):
+        items.extend(page)
+    return items
+
+
 def get_users():
     """Obtain users in account"""
-    response = get_rbac_data(path=USER_ENDPONT, params={"limit": "100"})
-    return response.get("data", [])
+    return get_rbac_list(USER_ENDPONT)
 
 
-def _get_access(username):
-    """Obtain user access."""
+def _get_users_batch(usernames):
     response = get_rbac_data(
-        path=ACCESS_ENDPOINT, params={"limit": "100", "application": "cost-management", "username": username}
+        path=USER_ENDPONT, params={"usernames": ",".join(usernames), "limit": str(len(usernames))}
     )
-    return response.get("data", [])
+    if "data" not in response:
+        return None
+    users = response.get("data", [])
+    requested = {username.lower() for username in usernames}
+    if any(str(user.get("username", "")).lower() not in requested for user in users):
+        # The usernames filter was not applied, the result cannot be trusted.
+        return None
+    return users
+
+
+def get_users_by_username(usernames, batch_size=USERNAME_BATCH_SIZE):
+    """Obtain the principals for the given usernames in batched queries.
+
+    Returns None when the targeted lookup is unavailable.
+    """
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        return []
+    batches = [usernames[i : i + batch_size] for i in range(0, len(usernames), batch_size)]
+    results = list(_RBAC_EXECUTOR.map(_get_users_batch, batches))
+    if any(result is None for result in results):
+        return None
+    return [user for result in results for user in result]
+
+
+def get_recipient_users(usernames):
+    """Obtain the principals of the configured recipients.
+
+    The principals endpoint is queried by username and the whole principal
+    list is only scanned when the targeted lookup is unavailable. Usernames
+    are matched regardless of case.
+    """
+    if Config.RBAC_TARGETED_LOOKUP:
+        start = time.monotonic()
+        users = get_users_by_username(usernames)
+        print(f"Targeted principal lookup took {time.monotonic() - start:.2f}s.")
+        if users is not None:
+            print(f"Found {len(users)} of {len(usernames)} recipients.")
+            return users
+        print("Targeted principal lookup unavailable, scanning all principals.")
+
+    start = time.monotonic()
+    account_users = get_users()
+    print(f"Account has {len(account_users)} users.")
+    print(f"Full principal scan took {time.monotonic() - start:.2f}s.")
+    requested = {username.lower() for username in usernames}
+    return [user for user in account_users if str(user.get("username", "")).lower() in requested]
+
+
+def _get_access(username):
+    """Obtain user access."""
+    return get_rbac_list(ACCESS_ENDPOINT, params={"application": "cost-management", "username": username})
 
 
 def get_access(username, permissions):
@@ -87,3 +228,12 @@ def get_access(username, permissions):
                 elif def_operation == "equal":
                     resources[access_perm].append(def_value)
     return resources
+
+
+def get_access_for_users(usernames, permissions):
+    """Obtain access for several users concurrently, keyed by username."""
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        return {}
+    all_access = _RBAC_EXECUTOR.map(lambda username: get_access(username, permissions), usernames)
+    return dict(zip(usernames, all_access))
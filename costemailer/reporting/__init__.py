@@ -1,6 +1,15 @@
 from costemailer import costquerier
+from costemailer import DEFAULT_REPORT_TYPE
+from costemailer import LOGO_PATH
+from costemailer.attachments import write_csv_attachment
+from costemailer.charting import plot_data
+from costemailer.email import email
+from costemailer.templating import render_template
 
 
+CHART_FILE_NAME = "daily_cost.png"
+_LOGO = {}
+
 API_ENDPOINTS = {
     "AWS": costquerier.AWS_COST_ENDPOINT,
     "OCP": costquerier.OPENSHIFT_COST_ENDPOINT,
@@ -9,32 +18,124 @@ API_ENDPOINTS = {
 }
 
 
-def get_daily_cost(report_type, params={}, is_org_admin=False):
-    api_endpoint = API_ENDPOINTS.get(report_type)
+def _daily_params(params, is_org_admin):
     daily_params = costquerier.CURRENT_COST_MONTH_PARAMS.copy()
     daily_params["filter[resolution]"] = "daily"
     if not is_org_admin:
         daily_params.update(params)
+    return daily_params
 
-    return costquerier.get_cost_data(path=api_endpoint, params=daily_params)
 
-
-def get_monthly_cost(report_type, params={}, is_org_admin=False):
-    api_endpoint = API_ENDPOINTS.get(report_type)
+def _monthly_params(params, is_org_admin):
     monthly_params = costquerier.CURRENT_COST_MONTH_PARAMS.copy()
     monthly_params["filter[resolution]"] = "monthly"
     monthly_params.update(params)
     # if not is_org_admin:
     #     monthly_params.update(params)
+    return monthly_params
+
+
+def _recommendation_params(params):
+    rec_params = costquerier.RECOMMENDATION_PARAMS.copy()
+    rec_params.update(params)
+    return rec_params
+
 
-    return costquerier.get_cost_data(path=api_endpoint, params=monthly_params)
+def get_daily_cost(report_type, params={}, is_org_admin=False):
+    api_endpoint = API_ENDPOINTS.get(report_type)
+    return costquerier.get_cost_data(path=api_endpoint, params=_daily_params(params, is_org_admin))
+
+
+def get_monthly_cost(report_type, params={}, is_org_admin=False):
+    api_endpoint = API_ENDPOINTS.get(report_type)
+    return costquerier.get_cost_data(path=api_endpoint, params=_monthly_params(params, is_org_admin))
 
 
 def get_recommendations(report_type, params, is_org_admin=False):
     if report_type != "OCP":
         return {}
     api_endpoint = costquerier.OPENSHIFT_RECOMMENDATIONS_ENDPOINT
-    rec_params = costquerier.RECOMMENDATION_PARAMS.copy()
-    rec_params.update(params)
+    return costquerier.get_cost_data(path=api_endpoint, params=_recommendation_params(params))
+
+
+async def get_daily_cost_async(report_type, params={}, is_org_admin=False):
+    api_endpoint = API_ENDPOINTS.get(report_type)
+    return await costquerier.get_cost_data_async(path=api_endpoint, params=_daily_params(params, is_org_admin))
+
+
+async def get_monthly_cost_async(report_type, params={}, is_org_admin=False):
+    api_endpoint = API_ENDPOINTS.get(report_type)
+    return await costquerier.get_cost_data_async(path=api_endpoint, params=_monthly_params(params, is_org_admin))
+
+
+async def get_recommendations_async(report_type, params, is_org_admin=False):
+    if report_type != "OCP":
+        return {}
+    api_endpoint = costquerier.OPENSHIFT_RECOMMENDATIONS_ENDPOINT
+    return await costquerier.get_cost_data_async(path=api_endpoint, params=_recommendation_params(params))
+
+
+def has_daily_values(daily_costs):
+    """Determine if the daily cost response holds any values to report."""
+    daily_data = daily_costs.get("data", [])
+    return any(day_data.get("values") for day_data in daily_data)
+
+
+def build_message(email_item, subject, template_variables, chart_data=None, csv_files=None, report_feature="cost"):
+    """Describe an email of the report for the render stage.
+
+    csv_files is a list of (file name, fieldnames, rows) tuples attached as CSV files. rows may be
+    a generator, it is consumed once when the message is rendered.
+    """
+    title_suffix = email_item.get("title_suffix")
+    if title_suffix:
+        subject += f" [{title_suffix}]"
+    return {
+        "report_type": email_item.get("report_type", DEFAULT_REPORT_TYPE),
+        "report_feature": report_feature,
+        "recipients": [email_item.get("user", {}).get("email")] + email_item.get("cc", []),
+        "subject": subject,
+        "template_variables": template_variables,
+        "chart_data": chart_data,
+        "csv_files": csv_files or [],
+    }
+
+
+def get_logo_attachment():
+    """Obtain the logo attachment, read from disk once per process."""
+    if "logo" not in _LOGO:
+        with open(LOGO_PATH, "rb") as logo:
+            _LOGO["logo"] = (LOGO_PATH.name, logo.read())
+    return _LOGO["logo"]
+
+
+def render_message(message):
+    """Draw the chart, render the template and write the CSV attachments of a message."""
+    attachments = [get_logo_attachment()]
+    if message.get("chart_data"):
+        attachments.append((CHART_FILE_NAME, plot_data(message["chart_data"])))
+
+    template_variables = dict(message["template_variables"])
+    for file_name, _ in attachments:
+        template_variables[file_name] = file_name
+    content = render_template(message["report_type"], template_variables, report_feature=message["report_feature"])
+
+    for file_name, fieldnames, rows in message["csv_files"]:
+        attachments.append(write_csv_attachment(file_name, fieldnames, rows))
+
+    return {
+        "recipients": message["recipients"],
+        "subject": message["subject"],
+        "content": content,
+        "attachments": attachments,
+    }
+
 
-    return costquerier.get_cost_data(path=api_endpoint, params=rec_params)
+def send_message(rendered):
+    """Send a rendered message."""
+    email(
+        recipients=rendered["recipients"],
+        subject=rendered["subject"],
+        content=rendered["content"],
+        attachments=rendered["attachments"],
+    )
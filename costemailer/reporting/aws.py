@@ -1,23 +1,26 @@
-import csv
-import os
-import tempfile
+import asyncio
+import itertools
 
 from costemailer import CURRENCY_SYMBOLS_MAP
 from costemailer import DEFAULT_ACCOUNT_LIMIT
 from costemailer import DEFAULT_ORDER
 from costemailer import DEFAULT_ORG_LEVEL_LIMIT
-from costemailer import DEFAULT_REPORT_ISO_DAYS
 from costemailer import DEFAULT_REPORT_TYPE
-from costemailer import get_email_content
 from costemailer import PRODUCTION_ENDPOINT
-from costemailer.charting import plot_data
+from costemailer.aggregation import get_breakdown_values
+from costemailer.aggregation import get_totals
+from costemailer.aggregation import order_records
+from costemailer.aggregation import order_values
+from costemailer.config import Config
 from costemailer.costquerier import AWS_COST_CATEGORIES_ENDPOINT
 from costemailer.costquerier import get_cost_data
-from costemailer.email import email
+from costemailer.costquerier import run_queries
 from costemailer.email import email_subject
+from costemailer.orgunits import get_org_unit_index
+from costemailer.reporting import build_message
 from costemailer.reporting import get_daily_cost
-from costemailer.reporting import get_monthly_cost
-from jinja2 import Template
+from costemailer.reporting import get_monthly_cost_async
+from costemailer.reporting import has_daily_values
 
 
 AWS_REPORT_VIEW_ORG_UNITS = "ou"
@@ -31,83 +34,102 @@ def get_cost_centers():
     return cost_centers
 
 
-def get_org_level(parent_org, aws_orgs_access, all_aws_orgs):
-    org_level = 0
-    if not parent_org or parent_org in aws_orgs_access:
-        return org_level
-    parent_org_dict = all_aws_orgs.get(parent_org, {})
-    next_parent = parent_org_dict.get("parent_org")
-    if next_parent:
-        org_level = 1 + get_org_level(next_parent, aws_orgs_access, all_aws_orgs)
-    return org_level
+def get_report_org_units(account_org_units, org_index, aws_orgs_access):
+    """Obtain the org units to report, keyed by org unit id with their parent in the report.
+
+    These are the org units holding the accounts and their ancestors up to
+    the org units the user has access to, or up to the root without such
+    access. Each org unit is visited once, so this is linear in the number
+    of org units.
+    """
+    report_org_units = {}
+    for org_unit_id in account_org_units:
+        while org_unit_id is not None and org_unit_id not in report_org_units:
+            parent_org = org_index.get_parent(org_unit_id)
+            report_org_units[org_unit_id] = parent_org
+            if org_unit_id in aws_orgs_access:
+                break
+            org_unit_id = parent_org
+    return {
+        org_unit_id: parent_org if parent_org in report_org_units else None
+        for org_unit_id, parent_org in report_org_units.items()
+    }
 
 
-def construct_parent_org(parent_org, aws_orgs_access, all_aws_orgs, org_values):
-    parent_org_dict = all_aws_orgs.get(parent_org, {})
-    if not parent_org_dict:
-        return None
+def get_org_level(org_index, org_unit_id, aws_orgs_access):
+    """Obtain the depth of the org unit below the nearest org unit the user has access to.
+
+    Without such an org unit the depth is counted from the root, and the root
+    itself is level 1 like its children, as the report has always leveled it.
+    """
+    access_depths = [
+        org_index.get_depth(access_org_unit_id)
+        for access_org_unit_id in aws_orgs_access
+        if org_index.is_in_subtree(org_unit_id, access_org_unit_id)
+    ]
+    if not access_depths:
+        return max(org_index.get_depth(org_unit_id), 1)
+    return org_index.get_depth(org_unit_id) - max(access_depths)
+
+
+def rollup_org_costs(report_org_units, org_values):
+    """Add the cost of each org unit to its parents in a single post-order pass.
+
+    Returns the child org units of each org unit.
+    """
+    children = {}
+    roots = []
+    for org_unit_id, parent_org in report_org_units.items():
+        if parent_org is None:
+            roots.append(org_unit_id)
+        else:
+            children.setdefault(parent_org, []).append(org_unit_id)
 
-    next_parent = parent_org_dict.get("parent_org")
-    level = 0
-    if parent_org in aws_orgs_access:
-        next_parent = None
-    else:
-        level = 1 + get_org_level(next_parent, aws_orgs_access, all_aws_orgs)
-
-    parent_org_cost_dict = {
-        "org_unit_id": parent_org,
-        "org_unit_name": parent_org_dict.get("org_unit_name"),
-        "parent_org": parent_org_dict.get("parent_org"),
-        "level": level,
-        "cost": 0,
-        "delta": 0,
-    }
-    org_values[parent_org] = parent_org_cost_dict
-    return next_parent
-
-
-def apply_account_costs(org_dict, accounts_in_ous, debug=False):
-    org_unit_id = org_dict.get("org_unit_id")
-    if debug:
-        print(f"org={org_unit_id}")
-    for acct in accounts_in_ous.get(org_unit_id, []):
-        org_dict["cost"] = org_dict.get("cost", 0) + acct.get("cost", 0)
-        org_dict["delta"] = org_dict.get("delta", 0) + acct.get("delta", 0)
-        if debug:
-            print(f"acct={acct}")
-            print(f"org_dict={org_dict}")
-    return org_dict
-
-
-def apply_cost_to_parent_ou(parent_org, org_dict, org_values, orgs_in_ous, debug=False):
-    parent_org_dict = org_values.get(parent_org, {})
-    if debug:
-        print(f"org={org_dict.get('org_unit_id')}")
-        print(f"parent_org={parent_org}")
-    if parent_org_dict:
-        parent_org_dict["cost"] = parent_org_dict.get("cost", 0) + org_dict.get("cost", 0)
-        parent_org_dict["delta"] = parent_org_dict.get("delta", 0) + org_dict.get("delta", 0)
-        if not orgs_in_ous.get(parent_org):
-            orgs_in_ous[parent_org] = []
-        if debug:
-            print(f"Adding {org_dict.get('org_unit_id')} to {parent_org} list.")
-            print(f"parent_org_dict={parent_org_dict}")
-        orgs_in_ous[parent_org].append(org_dict)
-        org_values[parent_org] = parent_org_dict
-
-
-def email_report_cost_centers(
-    report_type,
-    monthly_params,
-    is_org_admin,
-    cost_order,
-    account_limit,
-    current_month,
-    total,
-    img_paths,
-    filtered_cost_centers,
-):
-    email_msg = None
+    orgs_in_ous = {}
+    for root in roots:
+        stack = [(root, False)]
+        while stack:
+            org_unit_id, visited = stack.pop()
+            if not visited:
+                stack.append((org_unit_id, True))
+                stack.extend((child, False) for child in children.get(org_unit_id, []))
+                continue
+            parent_org = report_org_units[org_unit_id]
+            if parent_org is not None:
+                org_dict = org_values[org_unit_id]
+                parent_org_dict = org_values[parent_org]
+                parent_org_dict["cost"] += org_dict["cost"]
+                parent_org_dict["delta"] += org_dict["delta"]
+                orgs_in_ous.setdefault(parent_org, []).append(org_dict)
+    return orgs_in_ous
+
+
+def get_cost_center_accounts(report_type, monthly_params, is_org_admin, cost_centers):
+    """Obtain the monthly account costs of each cost center, keyed by cost center.
+
+    Each cost center is queried separately and concurrently.
+    """
+    if not cost_centers:
+        return {}
+
+    cost_center_queries = []
+    for cost_center in cost_centers:
+        cost_center_params = monthly_params.copy()
+        cost_center_params["filter[aws_category:CostCenter]"] = cost_center
+        cost_center_queries.append(
+            get_monthly_cost_async(report_type=report_type, params=cost_center_params, is_org_admin=is_org_admin)
+        )
+
+    cost_center_results = run_queries(*cost_center_queries, concurrency=Config.AWS_COST_CENTER_CONCURRENCY)
+    cost_center_accounts = {}
+    for cost_center, monthly_costs in zip(cost_centers, cost_center_results):
+        monthly_data = monthly_costs.get("data", [{}])
+        cost_center_accounts[cost_center] = monthly_data[0].get("accounts", [])
+    return cost_center_accounts
+
+
+def get_report_cost_centers(filtered_cost_centers):
+    """Obtain the cost centers to report on, limited to the filtered cost centers if any."""
     cost_centers = []
     cost_centers_response = get_cost_centers()
     cost_centers_data = cost_centers_response.get("data", [])
@@ -119,42 +141,60 @@ def email_report_cost_centers(
             cost_centers = list(set(cost_centers).intersection(filtered_cost_centers))
         else:
             cost_centers = filtered_cost_centers
+    return cost_centers
+
 
-    my_total = 0
-    my_delta = 0
+def get_render_limit(account_limit):
+    """Obtain how many entries of each list the templates render, at most account_limit.
+
+    Templates hide the section of an empty list, so one entry is kept even
+    with a zero account limit.
+    """
+    return max(account_limit, 1)
+
+
+def get_account_dict(acct_datum):
+    return {
+        "account": acct_datum.get("account"),
+        "account_alias": acct_datum.get("account_alias"),
+        "cost": acct_datum.get("cost", {}).get("total").get("value"),
+        "delta": acct_datum.get("delta_value"),
+    }
+
+
+def build_cost_center_report(
+    cost_centers,
+    cost_center_accounts,
+    cost_order,
+    account_limit,
+    current_month,
+    total,
+):
+    render_limit = get_render_limit(account_limit)
+    values = []
     cost_centers_list = []
+    csv_accounts = []
     for cost_center in cost_centers:
-        cc_total = 0
-        cc_delta = 0
-        monthly_params["filter[aws_category:CostCenter]"] = cost_center
-        monthly_costs = get_monthly_cost(report_type=report_type, params=monthly_params, is_org_admin=is_org_admin)
-        monthly_data = monthly_costs.get("data", [{}])
-        accounts_data = monthly_data[0].get("accounts", [])
-        accounts_list = []
-        for acct_data in accounts_data:
-            acct_datum = acct_data.get("values", [{}])[0]
-            account_id = acct_datum.get("account")
-            account_alias = acct_datum.get("account_alias")
-            account_monthly_cost = acct_datum.get("cost", {}).get("total").get("value")
-            account_monthly_delta = acct_datum.get("delta_value")
-
-            cc_total += account_monthly_cost
-            cc_delta += account_monthly_delta
-            my_total += account_monthly_cost
-            my_delta += account_monthly_delta
-            account_dict = {
-                "account": account_id,
-                "account_alias": account_alias,
-                "cost": account_monthly_cost,
-                "delta": account_monthly_delta,
-            }
-            accounts_list.append(account_dict)
-        accounts_list = sorted(accounts_list, key=lambda i: i[cost_order], reverse=True)
-        cost_center_dict = {"name": cost_center, "cost": cc_total, "delta": cc_delta, "accounts": accounts_list}
+        accounts_values = get_breakdown_values(cost_center_accounts.get(cost_center, []))
+        values.extend(accounts_values)
+        cc_total, cc_delta = get_totals(accounts_values)
+        cost_center_dict = {
+            "name": cost_center,
+            "cost": cc_total,
+            "delta": cc_delta,
+            "accounts": [
+                get_account_dict(acct_datum)
+                for acct_datum in order_values(accounts_values, cost_order, limit=render_limit)
+            ],
+        }
         cost_centers_list.append(cost_center_dict)
-    cost_centers_list = sorted(cost_centers_list, key=lambda i: i[cost_order], reverse=True)
+        for acct_datum in accounts_values:
+            account_dict = get_account_dict(acct_datum)
+            account_dict["cost_center"] = cost_center
+            csv_accounts.append(account_dict)
+    cost_centers_list = order_records(cost_centers_list, cost_order)
+    my_total, my_delta = get_totals(values)
 
-    email_template = Template(get_email_content(report_type))
     template_variables = {
         "cost_timeframe": current_month,
         "aws_cost": float(my_total),
@@ -165,19 +205,12 @@ def email_report_cost_centers(
         "units": CURRENCY_SYMBOLS_MAP.get(total["units"]),
         "aws_img_index": 1,
     }
-    for img_path in img_paths:
-        file_name = img_path.split("/")[-1]
-        template_variables[file_name] = file_name
-    email_msg = email_template.render(**template_variables)
-    return email_msg, cost_centers_list
-
-
-def email_report_ou(  # noqa
-    report_type,
-    monthly_params,
-    is_org_admin,
-    aws_accounts_in_ou,
-    org_units,
+    return template_variables, csv_accounts
+
+
+def build_ou_report(
+    monthly_costs,
+    org_index,
     aws_accounts,
     aws_orgs_access,
     cost_order,
@@ -185,107 +218,57 @@ def email_report_ou(  # noqa
     account_limit,
     current_month,
     total,
-    img_paths,
 ):
-    email_msg = None
-    monthly_costs = get_monthly_cost(report_type=report_type, params=monthly_params, is_org_admin=is_org_admin)
     monthly_data = monthly_costs.get("data", [{}])
-    accounts_data = monthly_data[0].get("accounts", [])
-    orgs_in_ous = {}
+    account_breakdown = get_breakdown_values(monthly_data[0].get("accounts", []))
+    my_total, my_delta = get_totals(account_breakdown)
+    render_limit = get_render_limit(account_limit)
+
+    report_accounts = set(aws_accounts)
+    csv_accounts = []
     accounts_in_ous = {}
     accounts_not_in_ous = []
-    account_breakdown = []
-    org_values = {}
-    org_values_list = []
-    my_total = 0
-    my_delta = 0
-    for acct_data in accounts_data:
-        acct_datum = acct_data.get("values", [{}])[0]
-        account_breakdown.append(acct_datum)
-        account_id = acct_datum.get("account")
-        account_alias = acct_datum.get("account_alias")
-        account_monthly_cost = acct_datum.get("cost", {}).get("total").get("value")
-        account_monthly_delta = acct_datum.get("delta_value")
-
-        my_total += account_monthly_cost
-        my_delta += account_monthly_delta
-
-        aws_org = {}
-        cur_org_unit_id = aws_accounts_in_ou.get(account_alias)
-        cur_org_unit_name = None
-        if cur_org_unit_id:
-            aws_org = org_units.get(cur_org_unit_id, {})
-            cur_org_unit_name = aws_org.get("org_unit_name")
-        else:
-            print(f"{account_alias} not found in Org Units.")
-
-        account_dict = {
-            "account": account_id,
-            "account_alias": account_alias,
-            "cost": account_monthly_cost,
-            "delta": account_monthly_delta,
-            "parent": cur_org_unit_id,
-        }
-        if aws_accounts and account_id not in aws_accounts:
+    for acct_datum in account_breakdown:
+        account_dict = get_account_dict(acct_datum)
+        account_dict["parent"] = org_index.get_account_org_unit(account_dict["account_alias"])
+        if not account_dict["parent"]:
+            print(f"{account_dict['account_alias']} not found in Org Units.")
+        if report_accounts and account_dict["account"] not in report_accounts:
             continue
-
-        if not aws_org:
+        csv_accounts.append(account_dict)
+        if account_dict["parent"] is None:
             accounts_not_in_ous.append(account_dict)
         else:
-            if not accounts_in_ous.get(cur_org_unit_id, []):
-                accounts_in_ous[cur_org_unit_id] = []
-            accounts_in_ous[cur_org_unit_id].append(account_dict)
-            parent_org_id = aws_org.get("parent_org")
-            org_level = 0
-            if cur_org_unit_id not in aws_orgs_access:
-                org_level = 1 + get_org_level(parent_org_id, aws_orgs_access, org_units)
-            org_dict = {
-                "org_unit_id": cur_org_unit_id,
-                "org_unit_name": cur_org_unit_name,
-                "parent_org": parent_org_id,
-                "level": org_level,
-                "cost": account_monthly_cost,
-                "delta": account_monthly_delta,
-            }
-            if not org_values.get(cur_org_unit_id, {}):
-                org_values[cur_org_unit_id] = org_dict
-            else:
-                cur_org_value = org_values.get(cur_org_unit_id, {})
-                org_dict["cost"] = cur_org_value.get("cost", 0) + org_dict.get("cost", 0)
-                org_dict["delta"] = cur_org_value.get("delta", 0) + org_dict.get("delta", 0)
-                org_values[cur_org_unit_id] = org_dict
-
-            if cur_org_unit_id not in aws_orgs_access:
-                parent_org = aws_org.get("parent_org")
-                while parent_org:
-                    parent_org = construct_parent_org(parent_org, aws_orgs_access, org_units, org_values)
-
-    org_level = 5
-    cur_org_level_list = []
-    for i in range(org_level, -1, -1):
-        cur_org_level_list = []
-        for _, cur_org in org_values.items():
-            cur_level = cur_org.get("level")
-            if cur_level == i:
-                cur_org_level_list.append(cur_org)
-
-        for the_org in cur_org_level_list:
-            the_parent_org = the_org.get("parent_org")
-            apply_cost_to_parent_ou(the_parent_org, the_org, org_values, orgs_in_ous)
-
-    for _, org_value in org_values.items():
-        org_values_list.append(org_value)
-    org_values_list = sorted(org_values_list, key=lambda i: i[cost_order], reverse=True)
+            accounts_in_ous.setdefault(account_dict["parent"], []).append(account_dict)
 
-    for org_unit_id, org_list in orgs_in_ous.items():
-        org_list = sorted(org_list, key=lambda i: i[cost_order], reverse=True)
-        orgs_in_ous[org_unit_id] = org_list
+    org_values = {}
+    aws_orgs_access = {org_unit_id for org_unit_id in aws_orgs_access if org_unit_id in org_index}
+    report_org_units = get_report_org_units(accounts_in_ous, org_index, aws_orgs_access)
+    for org_unit_id in report_org_units:
+        accounts = accounts_in_ous.get(org_unit_id, [])
+        org_values[org_unit_id] = {
+            "org_unit_id": org_unit_id,
+            "org_unit_name": org_index.get_name(org_unit_id),
+            "parent_org": org_index.get_parent(org_unit_id),
+            "level": get_org_level(org_index, org_unit_id, aws_orgs_access),
+            "cost": sum(acct["cost"] for acct in accounts),
+            "delta": sum(acct["delta"] for acct in accounts),
+        }
+    orgs_in_ous = rollup_org_costs(report_org_units, org_values)
 
     for org_unit_id, acct_list in accounts_in_ous.items():
-        acct_list = sorted(acct_list, key=lambda i: i[cost_order], reverse=True)
-        accounts_in_ous[org_unit_id] = acct_list
+        accounts_in_ous[org_unit_id] = order_records(acct_list, cost_order, limit=render_limit)
+    not_in_ous_count = len(accounts_not_in_ous)
+    accounts_not_in_ous = order_records(accounts_not_in_ous, cost_order, limit=render_limit)
+
+    filtered_org_list = order_records(
+        [org for org in org_values.values() if org["level"] <= org_level_limit], cost_order
+    )
+
+    for org_unit_id, org_list in orgs_in_ous.items():
+        orgs_in_ous[org_unit_id] = order_records(org_list, cost_order, limit=render_limit)
 
-    for ov in org_values_list:
+    for ov in filtered_org_list:
         print(f"{ov}")
         org_unit_id = ov.get("org_unit_id")
         org_list = orgs_in_ous.get(org_unit_id, [])
@@ -295,27 +278,12 @@ def email_report_ou(  # noqa
         for acct in acct_list:
             print(f"    {acct}")
 
-    accounts_not_in_ous = sorted(accounts_not_in_ous, key=lambda i: i[cost_order], reverse=True)
-
-    if cost_order == "delta":
-        account_breakdown = sorted(account_breakdown, key=lambda i: i["delta_value"], reverse=True)
-    else:
-        account_breakdown = sorted(account_breakdown, key=lambda i: i["cost"]["total"]["value"], reverse=True)
-
-    print(f"org_values_list={len(org_values_list)}")
-    print(f"accounts_not_in_ous={len(accounts_not_in_ous)}")
+    print(f"org_values_list={len(org_values)}")
+    print(f"accounts_not_in_ous={not_in_ous_count}")
     print(f"account_breakdown={len(account_breakdown)}")
 
-    filtered_org_list = []
-    unique_org_list = []
-    for org in org_values_list:
-        org_unit_id = org.get("org_unit_id")
-        if org_unit_id not in unique_org_list:
-            unique_org_list.append(org_unit_id)
-            if org.get("level", 5) <= org_level_limit:
-                filtered_org_list.append(org)
+    account_breakdown = order_values(account_breakdown, cost_order, limit=render_limit)
 
-    email_template = Template(get_email_content(report_type))
     template_variables = {
         "cost_timeframe": current_month,
         "aws_cost": float(my_total),
@@ -330,33 +298,21 @@ def email_report_ou(  # noqa
         "units": CURRENCY_SYMBOLS_MAP.get(total["units"]),
         "aws_img_index": 1,
     }
-    for img_path in img_paths:
-        file_name = img_path.split("/")[-1]
-        template_variables[file_name] = file_name
-    email_msg = email_template.render(**template_variables)
-    return email_msg, accounts_in_ous, accounts_not_in_ous
+    return template_variables, csv_accounts
 
 
-def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
+def fetch_report_data(email_item, **kwargs):
+    """Query the cost data of the report, returns None when there is nothing to report."""
     report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
-    report_schedule = email_item.get("schedule", DEFAULT_REPORT_ISO_DAYS)
     report_view = email_item.get("view", DEFAULT_AWS_REPORT_VIEW)
     report_filter = email_item.get("filter", {})
-    report_title_suffix = email_item.get("title_suffix")
     filtered_accounts = report_filter.get("accounts", [])
     filtered_orgs = report_filter.get("orgs", [])
     filtered_cost_centers = report_filter.get("cost_centers", [])
-    aws_accounts_in_ou = kwargs.get("aws_accounts_in_ou", {})
-    org_units = kwargs.get("org_units", {})
-    cost_order = email_item.get("order", DEFAULT_ORDER)
     print(f"User info: {email_item}.")
-    curr_user_email = email_item.get("user", {}).get("email")
-    email_addrs = [curr_user_email] + email_item.get("cc", [])
     is_org_admin = email_item.get("user", {}).get("is_org_admin", False)
     aws_accounts = email_item.get("aws.account", [])
     aws_orgs_access = email_item.get("aws.organizational_unit", [])
-    org_level_limit = email_item.get("org_level_limit", DEFAULT_ORG_LEVEL_LIMIT)
-    account_limit = email_item.get("account_limit", DEFAULT_ACCOUNT_LIMIT)
 
     if filtered_orgs:
         if aws_orgs_access:
@@ -372,7 +328,7 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
     daily_costs = {}
     if not is_org_admin and not (len(aws_accounts) or len(aws_orgs_access)):
         print("User has no access.")
-        return
+        return None
 
     monthly_params = {"group_by[account]": "*"}
     daily_params = {}
@@ -388,130 +344,117 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
             monthly_params["filter[aws_category:CostCenter]"] = ",".join(filtered_cost_centers)
 
     daily_costs = get_daily_cost(report_type=report_type, params=daily_params, is_org_admin=is_org_admin)
+    if not has_daily_values(daily_costs):
+        print("Empty daily data values ... skipping report.")
+        return None
+
+    monthly_costs = {}
+    org_index = None
+    if report_view == AWS_REPORT_VIEW_ORG_UNITS:
+        monthly_costs, org_index = run_queries(
+            get_monthly_cost_async(report_type=report_type, params=monthly_params, is_org_admin=is_org_admin),
+            asyncio.to_thread(get_org_unit_index),
+        )
+
+    cost_centers = []
+    cost_center_accounts = {}
+    if report_view == AWS_REPORT_VIEW_COST_CENTER:
+        cost_centers = get_report_cost_centers(filtered_cost_centers)
+        cost_center_accounts = get_cost_center_accounts(report_type, monthly_params, is_org_admin, cost_centers)
+
+    return {
+        "daily_costs": daily_costs,
+        "monthly_costs": monthly_costs,
+        "cost_centers": cost_centers,
+        "cost_center_accounts": cost_center_accounts,
+        "org_index": org_index,
+        "aws_accounts": aws_accounts,
+        "aws_orgs_access": aws_orgs_access,
+    }
+
+
+def aggregate_report_data(email_item, report_data, **kwargs):
+    """Summarize the fetched cost data into the messages to render."""
+    report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
+    report_view = email_item.get("view", DEFAULT_AWS_REPORT_VIEW)
+    cost_order = email_item.get("order", DEFAULT_ORDER)
+    org_level_limit = email_item.get("org_level_limit", DEFAULT_ORG_LEVEL_LIMIT)
+    account_limit = email_item.get("account_limit", DEFAULT_ACCOUNT_LIMIT)
+    daily_costs = report_data["daily_costs"]
     meta = daily_costs.get("meta", {})
     daily_data = daily_costs.get("data", [])
 
-    values_present = False
-    for day_data in daily_data:
-        if day_data.get("values"):
-            values_present = True
-
-    if not daily_data or not values_present:
-        print("Empty daily data values ... skipping report.")
-        return
-
-    img_file, img_path = plot_data(daily_data)
-    images.append(img_file)
-    img_paths.append(img_path)
-
-    if len(daily_data) > 0:
-        daily = daily_data[0]
-        date = daily["date"]
-        total = meta["total"]["cost"]["total"]
-        formatted_total = "{:.2f}".format(total["value"])
-        formatted_delta = "{:.2f}".format(meta["delta"]["value"])
-        current_month = date[:-3]
-        print(
-            f"AWS costs for {current_month} are {formatted_total}"
-            f' {total["units"]} with a delta of'
-            f' {formatted_delta} {total["units"]}'
+    daily = daily_data[0]
+    date = daily["date"]
+    total = meta["total"]["cost"]["total"]
+    formatted_total = "{:.2f}".format(total["value"])
+    formatted_delta = "{:.2f}".format(meta["delta"]["value"])
+    current_month = date[:-3]
+    print(
+        f"AWS costs for {current_month} are {formatted_total}"
+        f' {total["units"]} with a delta of'
+        f' {formatted_delta} {total["units"]}'
+    )
+
+    template_variables = {}
+    ou_accounts = None
+    cc_accounts = None
+    if report_view == AWS_REPORT_VIEW_ORG_UNITS:
+        template_variables, ou_accounts = build_ou_report(
+            report_data["monthly_costs"],
+            report_data["org_index"],
+            report_data["aws_accounts"],
+            report_data["aws_orgs_access"],
+            cost_order,
+            org_level_limit,
+            account_limit,
+            current_month,
+            total,
         )
-
-        email_msg = None
-        accounts_in_ous = None
-        accounts_not_in_ous = None
-        cost_center_list = None
-        if report_view == AWS_REPORT_VIEW_ORG_UNITS:
-            email_msg, accounts_in_ous, accounts_not_in_ous = email_report_ou(
-                report_type,
-                monthly_params,
-                is_org_admin,
-                aws_accounts_in_ou,
-                org_units,
-                aws_accounts,
-                aws_orgs_access,
-                cost_order,
-                org_level_limit,
-                account_limit,
-                current_month,
-                total,
-                img_paths,
-            )
-        elif report_view == AWS_REPORT_VIEW_COST_CENTER:
-            email_msg, cost_center_list = email_report_cost_centers(
-                report_type,
-                monthly_params,
-                is_org_admin,
-                cost_order,
-                account_limit,
-                current_month,
-                total,
-                img_paths,
-                filtered_cost_centers,
-            )
-
-        subject = email_subject(report_type)
-        if report_title_suffix:
-            subject += f" [{report_title_suffix}]"
-
-        tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-        with open(tmp.name, "w", newline="") as csvfile:
-            fieldnames = ["account", "account_alias", "cost", "delta"]
-            if accounts_in_ous or accounts_not_in_ous:
-                fieldnames.append("org_unit")
-            if cost_center_list:
-                fieldnames.append("cost_center")
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            writer.writeheader()
-            if accounts_in_ous:
-                for _, accts in accounts_in_ous.items():
-                    for acct in accts:
-                        writer.writerow(
-                            {
-                                "account": acct.get("account"),
-                                "account_alias": acct.get("account_alias"),
-                                "cost": acct.get("cost"),
-                                "delta": acct.get("delta"),
-                                "org_unit": acct.get("parent", ""),
-                            }
-                        )
-            if accounts_not_in_ous:
-                for acct in accounts_not_in_ous:
-                    writer.writerow(
-                        {
-                            "account": acct.get("account"),
-                            "account_alias": acct.get("account_alias"),
-                            "cost": acct.get("cost"),
-                            "delta": acct.get("delta"),
-                            "org_unit": acct.get("parent", ""),
-                        }
-                    )
-            if cost_center_list:
-                for cost_center in cost_center_list:
-                    accts = cost_center.get("accounts", [])
-                    for acct in accts:
-                        writer.writerow(
-                            {
-                                "account": acct.get("account"),
-                                "account_alias": acct.get("account_alias"),
-                                "cost": acct.get("cost"),
-                                "delta": acct.get("delta"),
-                                "cost_center": cost_center.get("name"),
-                            }
-                        )
-        images.append(tmp)
-        img_paths.append(tmp.name)
-
-        email(
-            recipients=email_addrs,
-            subject=subject,
-            content=email_msg,
-            attachments=img_paths,
-            email_iso_days=report_schedule,
+    elif report_view == AWS_REPORT_VIEW_COST_CENTER:
+        template_variables, cc_accounts = build_cost_center_report(
+            report_data["cost_centers"],
+            report_data["cost_center_accounts"],
+            cost_order,
+            account_limit,
+            current_month,
+            total,
         )
 
-        for img in images:
-            if os.path.exists(img.name):
-                os.unlink(img.name)
-                img.close()
+    # The CSV holds every account, in the order of the API response rather than the rendered order.
+    fieldnames = ["account", "account_alias", "cost", "delta"]
+    if ou_accounts:
+        fieldnames.append("org_unit")
+    if cc_accounts:
+        fieldnames.append("cost_center")
+
+    ou_rows = (
+        {
+            "account": acct.get("account"),
+            "account_alias": acct.get("account_alias"),
+            "cost": acct.get("cost"),
+            "delta": acct.get("delta"),
+            "org_unit": acct.get("parent", ""),
+        }
+        for acct in ou_accounts or []
+    )
+    cc_rows = (
+        {
+            "account": acct.get("account"),
+            "account_alias": acct.get("account_alias"),
+            "cost": acct.get("cost"),
+            "delta": acct.get("delta"),
+            "cost_center": acct.get("cost_center"),
+        }
+        for acct in cc_accounts or []
+    )
+    rows = itertools.chain(ou_rows, cc_rows)
+
+    message = build_message(
+        email_item,
+        email_subject(report_type),
+        template_variables,
+        chart_data=daily_data,
+        csv_files=[("aws_accounts.csv", fieldnames, rows)],
+    )
+    return [message]
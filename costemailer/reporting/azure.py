@@ -1,34 +1,25 @@
-import csv
-import os
-import tempfile
-
 from costemailer import costquerier
 from costemailer import CURRENCY_SYMBOLS_MAP
 from costemailer import DEFAULT_ORDER
-from costemailer import DEFAULT_REPORT_ISO_DAYS
 from costemailer import DEFAULT_REPORT_TYPE
-from costemailer import get_email_content
 from costemailer import PRODUCTION_ENDPOINT
-from costemailer.charting import plot_data
-from costemailer.email import email
+from costemailer.aggregation import order_values
+from costemailer.costquerier import run_queries
 from costemailer.email import email_subject
-from costemailer.reporting import get_daily_cost
-from costemailer.reporting import get_monthly_cost
-from jinja2 import Template
+from costemailer.reporting import build_message
+from costemailer.reporting import get_daily_cost_async
+from costemailer.reporting import get_monthly_cost_async
+from costemailer.reporting import has_daily_values
 
 
-def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
+def fetch_report_data(email_item, **kwargs):
+    """Query the cost data of the report, returns None when there is nothing to report."""
     report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
-    report_schedule = email_item.get("schedule", DEFAULT_REPORT_ISO_DAYS)
     report_filter = email_item.get("filter", {})
-    report_title_suffix = email_item.get("title_suffix")
     filtered_subscriptions = report_filter.get("subscriptions", [])
     print(f"User info: {email_item}.")
-    curr_user_email = email_item.get("user", {}).get("email")
-    email_addrs = [curr_user_email] + email_item.get("cc", [])
     is_org_admin = email_item.get("user", {}).get("is_org_admin", False)
     azure_subscriptions = email_item.get("azure.subscription", [])
-    cost_order = email_item.get("order", DEFAULT_ORDER)
 
     if filtered_subscriptions:
         if azure_subscriptions:
@@ -39,7 +30,7 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
     daily_costs = {}
     monthly_costs = {}
     if not is_org_admin and not (len(azure_subscriptions)):
-        return
+        return None
 
     monthly_params = {"group_by[subscription_guid]": "*"}
     daily_params = {}
@@ -47,60 +38,56 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
         daily_params["filter[subscription_guid]"] = ",".join(azure_subscriptions)
         monthly_params["filter[subscription_guid]"] = ",".join(azure_subscriptions)
 
-    daily_costs = get_daily_cost(report_type=report_type, params=daily_params, is_org_admin=is_org_admin)
-    monthly_costs = get_monthly_cost(report_type=report_type, params=monthly_params, is_org_admin=is_org_admin)
-    meta = daily_costs.get("meta", {})
-    daily_data = daily_costs.get("data", [])
-
-    values_present = False
-    for day_data in daily_data:
-        if day_data.get("values"):
-            values_present = True
+    daily_costs, monthly_costs = run_queries(
+        get_daily_cost_async(report_type=report_type, params=daily_params, is_org_admin=is_org_admin),
+        get_monthly_cost_async(report_type=report_type, params=monthly_params, is_org_admin=is_org_admin),
+    )
 
-    if not daily_data or not values_present:
+    if not has_daily_values(daily_costs):
         print("Empty daily data values ... skipping report.")
-        return
+        return None
+    return {"daily_costs": daily_costs, "monthly_costs": monthly_costs}
 
-    img_file, img_path = plot_data(daily_data)
-    images.append(img_file)
-    img_paths.append(img_path)
 
-    if len(daily_data) > 0:
-        daily = daily_data[0]
-        date = daily["date"]
-        total = meta["total"]["cost"]["total"]
-        formatted_total = "{:.2f}".format(total["value"])
-        formatted_delta = "{:.2f}".format(meta["delta"]["value"])
-        current_month = date[:-3]
-        print(
-            f"Azure costs for {current_month} are {formatted_total}"
-            f' {total["units"]} with a delta of'
-            f' {formatted_delta} {total["units"]}'
-        )
+def aggregate_report_data(email_item, report_data, **kwargs):
+    """Summarize the fetched cost data into the Azure message."""
+    report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
+    filtered_subscriptions = email_item.get("filter", {}).get("subscriptions", [])
+    cost_order = email_item.get("order", DEFAULT_ORDER)
+    daily_costs = report_data["daily_costs"]
+    monthly_costs = report_data["monthly_costs"]
+    meta = daily_costs.get("meta", {})
+    daily_data = daily_costs.get("data", [])
 
-        monthly_data = monthly_costs.get("data", [{}])
-        subscription_data = monthly_data[0].get("subscription_guids", [])
+    daily = daily_data[0]
+    date = daily["date"]
+    total = meta["total"]["cost"]["total"]
+    formatted_total = "{:.2f}".format(total["value"])
+    formatted_delta = "{:.2f}".format(meta["delta"]["value"])
+    current_month = date[:-3]
+    print(
+        f"Azure costs for {current_month} are {formatted_total}"
+        f' {total["units"]} with a delta of'
+        f' {formatted_delta} {total["units"]}'
+    )
 
-        subscription_breakdown = []
-        for sub_data in subscription_data:
-            sub_datum = sub_data.get("values", [{}])[0]
-            if "No-subscription_guid" in sub_datum.get("subscription_guid"):
-                continue
-            if filtered_subscriptions:
-                for fc in filtered_subscriptions:
-                    if fc in sub_datum.get("subscription_guid"):
-                        subscription_breakdown.append(sub_datum)
-                    break
-            else:
-                subscription_breakdown.append(sub_datum)
-        if cost_order == "delta":
-            subscription_breakdown = sorted(subscription_breakdown, key=lambda i: i["delta_value"], reverse=True)
+    monthly_data = monthly_costs.get("data", [{}])
+    subscription_data = monthly_data[0].get("subscription_guids", [])
+
+    subscription_breakdown = []
+    for sub_data in subscription_data:
+        sub_datum = sub_data.get("values", [{}])[0]
+        if "No-subscription_guid" in sub_datum.get("subscription_guid"):
+            continue
+        if filtered_subscriptions:
+            for fc in filtered_subscriptions:
+                if fc in sub_datum.get("subscription_guid"):
+                    subscription_breakdown.append(sub_datum)
+                break
         else:
-            subscription_breakdown = sorted(
-                subscription_breakdown, key=lambda i: i["cost"]["total"]["value"], reverse=True
-            )
+            subscription_breakdown.append(sub_datum)
+    subscription_breakdown = order_values(subscription_breakdown, cost_order)
 
-    email_template = Template(get_email_content(report_type))
     template_variables = {
         "cost_timeframe": current_month,
         "azure_cost": float(formatted_total),
@@ -110,41 +97,22 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
         "units": CURRENCY_SYMBOLS_MAP.get(total["units"]),
         "azure_img_index": 1,
     }
-    for img_path in img_paths:
-        file_name = img_path.split("/")[-1]
-        template_variables[file_name] = file_name
-    email_msg = email_template.render(**template_variables)
-    subject = email_subject(report_type)
-    if report_title_suffix:
-        subject += f" [{report_title_suffix}]"
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-    with open(tmp.name, "w", newline="") as csvfile:
-        fieldnames = ["subscription_id", "subscription_name", "cost", "delta"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        writer.writeheader()
-        for sub in subscription_breakdown:
-            writer.writerow(
-                {
-                    "subscription_id": sub.get("subscription_guid"),
-                    "subscription_name": sub.get("subscription_name"),
-                    "cost": sub.get("cost", {}).get("total", {}).get("value"),
-                    "delta": sub.get("delta_value"),
-                }
-            )
-    images.append(tmp)
-    img_paths.append(tmp.name)
-
-    email(
-        recipients=email_addrs,
-        subject=subject,
-        content=email_msg,
-        attachments=img_paths,
-        email_iso_days=report_schedule,
+    rows = (
+        {
+            "subscription_id": sub.get("subscription_guid"),
+            "subscription_name": sub.get("subscription_name"),
+            "cost": sub.get("cost", {}).get("total", {}).get("value"),
+            "delta": sub.get("delta_value"),
+        }
+        for sub in subscription_breakdown
     )
-
-    for img in images:
-        if os.path.exists(img.name):
-            os.unlink(img.name)
-            img.close()
+    return [
+        build_message(
+            email_item,
+            email_subject(report_type),
+            template_variables,
+            chart_data=daily_data,
+            csv_files=[("azure_subscriptions.csv", ["subscription_id", "subscription_name", "cost", "delta"], rows)],
+        )
+    ]
@@ -1,69 +1,67 @@
-import csv
-import os
-import tempfile
-import time
 from datetime import date
 
-import requests
 from costemailer import CURRENCY_SYMBOLS_MAP
 from costemailer import DEFAULT_ORDER
-from costemailer import DEFAULT_REPORT_ISO_DAYS
 from costemailer import DEFAULT_REPORT_TYPE
-from costemailer import get_email_content
 from costemailer import PRODUCTION_ENDPOINT
-from costemailer.charting import plot_data
-from costemailer.email import email
 from costemailer.email import email_subject
-from jinja2 import Template
+from costemailer.reporting import build_message
 
 from ..config import Config
+from ..retry import is_json_response
+from ..retry import RetryPolicy
+from ..session import get_session
+from ..tokencache import TokenCache
+
+
+IBM_API_RETRY = RetryPolicy()
 
 
 def get_current_month():
     return f"{date.today().year}-{date.today().month:02}"
 
 
-def get_bearer_token(retry_count=0):
-    """Obtain the bearer token."""
+def _request_bearer_token():
+    """Request a new bearer token."""
     api_call = "https://iam.cloud.ibm.com/identity/token"
     form_data = {"grant_type": "urn:ibm:params:oauth:grant-type:apikey", "apikey": Config.IBM_CLOUD_API_KEY}
     access_token = None
-    response = requests.post(url=api_call, data=form_data)
-    if retry_count < 3:
-        if (
-            response.status_code >= 200
-            and response.status_code < 300
-            and "application/json" in response.headers["content-type"]
-        ):
-            access_token = response.json().get("access_token")
-        else:
-            print(response.text)
-            time.sleep(10)
-            return get_bearer_token(retry_count=retry_count + 1)
+    expires_in = None
+    response = IBM_API_RETRY.send(lambda: get_session().post(url=api_call, data=form_data))
+    if is_json_response(response):
+        response_json = response.json()
+        access_token = response_json.get("access_token")
+        expires_in = response_json.get("expires_in")
+    else:
+        print(response.text)
 
-    return access_token
+    return access_token, expires_in
 
 
-def get_data(api_call, field, default=[], params={}, retry_count=0):
+BEARER_TOKEN = TokenCache(_request_bearer_token)
+
+
+def get_bearer_token():
+    """Obtain the bearer token, reusing it until shortly before expiry."""
+    return BEARER_TOKEN.get()
+
+
+def get_data(api_call, field, default=[], params={}):
     token = get_bearer_token()
     data = []
     if token:
-        response = requests.get(url=api_call, headers={"Authorization": f"Bearer {token}"}, params=params)
-        print(f"url={api_call}, response.status_code={response.status_code}")
-
-        if retry_count < 3:
-            if (
-                response.status_code >= 200
-                and response.status_code < 300
-                and "application/json" in response.headers["content-type"]
-            ):
-                data = response.json().get(field, default)
-            else:
-                print(response.text)
-                time.sleep(10)
-                return get_data(
-                    api_call=api_call, field=field, default=default, params=params, retry_count=retry_count + 1
-                )
+
+        def send_request():
+            headers = {"Authorization": f"Bearer {get_bearer_token()}"}
+            response = get_session().get(url=api_call, headers=headers, params=params)
+            print(f"url={api_call}, response.status_code={response.status_code}")
+            return response
+
+        response = IBM_API_RETRY.send(send_request, refresh_credentials=BEARER_TOKEN.invalidate)
+        if is_json_response(response):
+            data = response.json().get(field, default)
+        else:
+            print(response.text)
 
     return data
 
@@ -90,15 +88,11 @@ def get_account_costs(account_id):
     )
 
 
-def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
-    report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
-    report_schedule = email_item.get("schedule", DEFAULT_REPORT_ISO_DAYS)
+def fetch_report_data(email_item, **kwargs):
+    """Query the costs of the active accounts in each account group."""
     report_filter = email_item.get("filter", {})
-    report_title_suffix = email_item.get("title_suffix")
     filtered_accounts = report_filter.get("accounts", [])
     print(f"User info: {email_item}.")
-    curr_user_email = email_item.get("user", {}).get("email")
-    email_addrs = [curr_user_email] + email_item.get("cc", [])
 
     account_groups = get_account_groups()
     account_groups_dict = {}
@@ -133,6 +127,14 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
             }
             accts_in_ag[account_group_name].append(acct_dict)
 
+    return {"accts_in_ag": accts_in_ag}
+
+
+def aggregate_report_data(email_item, report_data, **kwargs):
+    """Total the account costs by account group into the IBM Cloud message."""
+    report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
+    accts_in_ag = report_data["accts_in_ag"]
+
     grand_total = 0
     grand_discounted_total = 0
     report_currency = "USD"
@@ -158,9 +160,8 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
 
     if grand_total == 0:
         print("Total cost is 0, skip sending email.")
-        return
+        return []
 
-    email_template = Template(get_email_content(report_type))
     template_variables = {
         "cost_timeframe": get_current_month(),
         "ibmcloud_cost": float(grand_total),
@@ -170,43 +171,23 @@ def email_report(email_item, images, img_paths, **kwargs):  # noqa: C901
         "web_url": PRODUCTION_ENDPOINT,
         "units": CURRENCY_SYMBOLS_MAP.get(report_currency),
     }
-    for img_path in img_paths:
-        file_name = img_path.split("/")[-1]
-        template_variables[file_name] = file_name
-    email_msg = email_template.render(**template_variables)
-    subject = email_subject(report_type)
-    if report_title_suffix:
-        subject += f" [{report_title_suffix}]"
-
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".csv")
-    with open(tmp.name, "w", newline="") as csvfile:
-        fieldnames = ["id", "name", "group", "cost", "currency"]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        writer.writeheader()
-        for acct_grp, accts in accts_in_ag.items():
-            for acct in accts:
-                writer.writerow(
-                    {
-                        "id": acct.get("id"),
-                        "name": acct.get("name"),
-                        "group": acct_grp,
-                        "cost": acct.get("cost"),
-                        "currency": acct.get("currency"),
-                    }
-                )
-    images.append(tmp)
-    img_paths.append(tmp.name)
-
-    email(
-        recipients=email_addrs,
-        subject=subject,
-        content=email_msg,
-        attachments=img_paths,
-        email_iso_days=report_schedule,
-    )
 
-    for img in images:
-        if os.path.exists(img.name):
-            os.unlink(img.name)
-            img.close()
+    rows = (
+        {
+            "id": acct.get("id"),
+            "name": acct.get("name"),
+            "group": acct_grp,
+            "cost": acct.get("cost"),
+            "currency": acct.get("currency"),
+        }
+        for acct_grp, accts in accts_in_ag.items()
+        for acct in accts
+    )
+    return [
+        build_message(
+            email_item,
+            email_subject(report_type),
+            template_variables,
+            csv_files=[("ibmcloud_accounts.csv", ["id", "name", "group", "cost", "currency"], rows)],
+        )
+    ]
@@ -0,0 +1,144 @@
+"""Shared retry policy for API requests."""
+import random
+import threading
+import time
+from datetime import datetime
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+
+from .config import Config
+
+
+MAX_RETRY_AFTER = 300
+RETRY_AFTER_STATUS_CODES = (429, 503)
+
+_STATS_LOCK = threading.Lock()
+_STATS = {"retries": 0, "wait_seconds": 0.0, "budget_exhausted": 0}
+_BUDGET = {"remaining": Config.RETRY_BUDGET}
+
+
+def is_json_response(response):
+    """Determine if the response is a successful JSON response."""
+    return (
+        response is not None
+        and response.status_code >= 200
+        and response.status_code < 300
+        and "application/json" in response.headers.get("content-type", "")
+    )
+
+
+def is_retryable(response):
+    """Determine if a request is worth retrying, client errors other than 429 are not."""
+    if response is None:
+        return True
+    return response.status_code == 429 or response.status_code >= 500
+
+
+def get_retry_after(response):
+    """Obtain the Retry-After delay in seconds, if the response provides one."""
+    if response is None or response.status_code not in RETRY_AFTER_STATUS_CODES:
+        return None
+    retry_after = response.headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        delay = float(retry_after)
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+        except (TypeError, ValueError):
+            return None
+        delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0), MAX_RETRY_AFTER)
+
+
+def _take_from_budget():
+    with _STATS_LOCK:
+        if _BUDGET["remaining"] <= 0:
+            _STATS["budget_exhausted"] += 1
+            return False
+        _BUDGET["remaining"] -= 1
+        return True
+
+
+def _record_wait(delay):
+    with _STATS_LOCK:
+        _STATS["retries"] += 1
+        _STATS["wait_seconds"] += delay
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After.
+
+    Retries draw from a budget shared by every policy for the whole run so a
+    failing upstream cannot stall the job with endless waits.
+    """
+
+    def __init__(self, max_attempts=None, base_delay=None, max_delay=None):
+        self.max_attempts = Config.RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.base_delay = Config.RETRY_BASE_DELAY if base_delay is None else base_delay
+        self.max_delay = Config.RETRY_MAX_DELAY if max_delay is None else max_delay
+
+    def backoff(self, attempt):
+        """Obtain the jittered delay before the given retry attempt."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2**attempt)))
+
+    def get_delay(self, attempt, response=None):
+        retry_after = get_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return self.backoff(attempt)
+
+    def send(self, send_request, refresh_credentials=None):
+        """Call send_request until it succeeds or retrying is no longer allowed.
+
+        Returns the last response. Connection errors are retried and re-raised
+        once attempts run out. With refresh_credentials, a 401 response is
+        taken as stale cached credentials: they are refreshed and the request
+        is sent once more right away.
+        """
+        attempt = 0
+        refreshed = False
+        while True:
+            error = None
+            try:
+                response = send_request()
+            except (requests.ConnectionError, requests.Timeout) as err:
+                error = err
+                response = None
+                print(f"Request failed: {err}")
+
+            if response is not None and response.status_code == 401 and refresh_credentials and not refreshed:
+                print("Request unauthorized, refreshing credentials.")
+                refresh_credentials()
+                refreshed = True
+                continue
+            if error is None and (is_json_response(response) or not is_retryable(response)):
+                return response
+            if attempt + 1 >= self.max_attempts or not _take_from_budget():
+                if error is not None:
+                    raise error
+                return response
+
+            delay = self.get_delay(attempt, response)
+            _record_wait(delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+def get_retry_stats():
+    """Obtain retry counts and time spent waiting."""
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+        stats["budget_remaining"] = _BUDGET["remaining"]
+    return stats
+
+
+def print_retry_stats():
+    stats = get_retry_stats()
+    print(
+        f"Retries={stats['retries']}, wait_seconds={stats['wait_seconds']:.1f},"
+        f" budget_remaining={stats['budget_remaining']}, budget_exhausted={stats['budget_exhausted']}"
+    )
@@ -0,0 +1,225 @@
+"""Staged pipeline running the per-recipient reports."""
+import io
+import queue
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from .config import Config
+
+
+class ThreadOutput(io.TextIOBase):
+    """Stream routing writes to a per-report buffer while one is active.
+
+    The buffer is held in a context variable so queries the report hands off
+    to the cost query pool are captured along with it.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._buffer = ContextVar("report_output", default=None)
+
+    def write(self, text):
+        buffer = self._buffer.get()
+        if buffer is not None:
+            return buffer.write(text)
+        return self._stream.write(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    @contextmanager
+    def capture(self, buffer=None):
+        """Collect everything the current report prints, into buffer if given."""
+        if buffer is None:
+            buffer = io.StringIO()
+        token = self._buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            self._buffer.reset(token)
+
+
+@contextmanager
+def threaded_output():
+    """Install a ThreadOutput on sys.stdout for the duration of the block."""
+    original = sys.stdout
+    output = ThreadOutput(original)
+    sys.stdout = output
+    try:
+        yield output
+    finally:
+        sys.stdout = original
+
+
+class Stage:
+    """Step of the report pipeline run by a pool of worker threads.
+
+    The stage function takes one item and returns the items for the next
+    stage. Items wait in a bounded queue so a slow stage holds back the
+    stages feeding it instead of buffering the whole run. A stage that only
+    hands its items off, like sending to the email queue, can be given the
+    delivery it hands off to so its completion timings are reported too.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=None, delivery=None):
+        self.name = name
+        self.fn = fn
+        self.workers = max(workers, 1)
+        self.queue = queue.Queue(maxsize=queue_size or Config.PIPELINE_QUEUE_SIZE)
+        self.delivery = delivery
+        self._lock = threading.Lock()
+        self.items = 0
+        self.busy = 0.0
+        self.first_start = None
+        self.last_done = None
+        self.max_depth = 0
+        self._depth_total = 0
+        self._depth_samples = 0
+
+    def put(self, job, item):
+        self.queue.put((job, item))
+        depth = self.queue.qsize()
+        with self._lock:
+            self.max_depth = max(self.max_depth, depth)
+            self._depth_total += depth
+            self._depth_samples += 1
+
+    def record(self, start, end):
+        with self._lock:
+            self.items += 1
+            self.busy += end - start
+            if self.first_start is None or start < self.first_start:
+                self.first_start = start
+            if self.last_done is None or end > self.last_done:
+                self.last_done = end
+
+    def get_stats(self):
+        """Obtain the stage counts and timings.
+
+        Throughput is items per second of wall-clock time from the first item
+        started to the last one done, so it includes the time workers were
+        blocked on queues; worker_rate is items per second of busy time.
+        """
+        with self._lock:
+            elapsed = self.last_done - self.first_start if self.items else 0.0
+            stats = {
+                "items": self.items,
+                "busy": self.busy,
+                "elapsed": elapsed,
+                "throughput": self.items / elapsed if elapsed else 0.0,
+                "worker_rate": self.items / self.busy if self.busy else 0.0,
+                "queue_max": self.max_depth,
+                "queue_avg": self._depth_total / self._depth_samples if self._depth_samples else 0.0,
+            }
+        if self.delivery is not None:
+            stats["delivery"] = self.delivery.get_delivery_stats()
+        return stats
+
+
+class _ReportJob:
+    """Progress of one report through the pipeline."""
+
+    def __init__(self, email_item):
+        self.email_item = email_item
+        self.buffer = io.StringIO()
+        self.failed = False
+        self.done = threading.Event()
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    def update(self, emitted):
+        """Account for a finished item that emitted items for the next stage."""
+        with self._lock:
+            self._pending += emitted - 1
+            if self._pending == 0:
+                self.done.set()
+
+
+class Pipeline:
+    """Run every report through the stages, overlapping the work of different reports."""
+
+    def __init__(self, stages):
+        self.stages = stages
+
+    def _work(self, output, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            entry = stage.queue.get()
+            if entry is None:
+                return
+            job, item = entry
+            emitted = []
+            start = time.monotonic()
+            with output.capture(job.buffer):
+                try:
+                    result = stage.fn(item)
+                    if next_stage is not None:
+                        emitted = list(result or [])
+                except Exception:
+                    job.failed = True
+                    print(f"Report {stage.name} failed for {job.email_item.get('user', {}).get('username')}:")
+                    traceback.print_exc(file=sys.stdout)
+            stage.record(start, time.monotonic())
+            job.update(len(emitted))
+            for next_item in emitted:
+                next_stage.put(job, next_item)
+
+    def run(self, email_list):
+        """Feed every report into the pipeline and print their output in list order.
+
+        Returns the number of failed reports.
+        """
+        jobs = [_ReportJob(email_item) for email_item in email_list]
+        failures = 0
+        with threaded_output() as output:
+            threads = []
+            for index, stage in enumerate(self.stages):
+                for worker in range(stage.workers):
+                    thread = threading.Thread(
+                        target=self._work, args=(output, index), name=f"{stage.name}-{worker}", daemon=True
+                    )
+                    thread.start()
+                    threads.append(thread)
+
+            def feed():
+                for job in jobs:
+                    self.stages[0].put(job, job.email_item)
+
+            feeder = threading.Thread(target=feed, name="feed", daemon=True)
+            feeder.start()
+            for job in jobs:
+                job.done.wait()
+                output.write(job.buffer.getvalue())
+                output.flush()
+                failures += job.failed
+            feeder.join()
+
+            for stage in self.stages:
+                for _ in range(stage.workers):
+                    stage.queue.put(None)
+            for thread in threads:
+                thread.join()
+        print(f"Reports processed={len(email_list)}, failed={failures}")
+        return failures
+
+    def print_stats(self):
+        for stage in self.stages:
+            stats = stage.get_stats()
+            print(
+                f"Stage {stage.name}: workers={stage.workers}, items={stats['items']},"
+                f" elapsed={stats['elapsed']:.2f}s, busy={stats['busy']:.2f}s,"
+                f" throughput={stats['throughput']:.2f}/s, worker_rate={stats['worker_rate']:.2f}/s,"
+                f" queue_max={stats['queue_max']}, queue_avg={stats['queue_avg']:.2f}"
+            )
+            delivery = stats.get("delivery")
+            if delivery is not None:
+                print(
+                    f"Stage {stage.name} delivery: items={delivery['items']}, elapsed={delivery['elapsed']:.2f}s,"
+                    f" throughput={delivery['throughput']:.2f}/s, latency_avg={delivery['latency_avg']:.2f}s,"
+                    f" latency_max={delivery['latency_max']:.2f}s"
+                )
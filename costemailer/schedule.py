@@ -0,0 +1,52 @@
+"""Planning of the reports scheduled to run today."""
+from datetime import datetime
+
+from costemailer import DEFAULT_REPORT_ISO_DAYS
+from costemailer import DEFAULT_REPORT_TYPE
+from costemailer.config import Config
+
+
+def get_user_reports(user_config):
+    """Obtain the report configurations of a recipient."""
+    return user_config.get("reports", []) or [user_config]
+
+
+def is_scheduled(report, day_num):
+    """Determine if the report runs on the given ISO weekday, every report runs in dev mode."""
+    return Config.RUNTIME_MODE == "dev" or day_num in report.get("schedule", DEFAULT_REPORT_ISO_DAYS)
+
+
+def get_scheduled_reports(recipients, day_num=None):
+    """Obtain the reports of each recipient scheduled for the given ISO weekday, keyed by username.
+
+    Recipients without a scheduled report are left out.
+    """
+    if day_num is None:
+        day_num = datetime.today().isoweekday()
+    scheduled_reports = {}
+    for username, user_config in recipients.items():
+        reports = [report for report in get_user_reports(user_config) if is_scheduled(report, day_num)]
+        if reports:
+            scheduled_reports[username] = reports
+    return scheduled_reports
+
+
+def print_plan(recipients, scheduled_reports, day_num=None):
+    """Print the reports that will run and how many are skipped."""
+    if day_num is None:
+        day_num = datetime.today().isoweekday()
+    total = sum(len(get_user_reports(user_config)) for user_config in recipients.values())
+    planned = sum(len(reports) for reports in scheduled_reports.values())
+    print(f"Report plan for ISO weekday {day_num}: {planned} of {total} reports scheduled.")
+    for username, reports in scheduled_reports.items():
+        user_report_type = recipients.get(username, {}).get("report_type", DEFAULT_REPORT_TYPE)
+        for report in reports:
+            report_type = report.get("report_type", user_report_type)
+            view = report.get("view", "ou") if report_type == "AWS" else None
+            title_suffix = report.get("title_suffix")
+            line = f"    {username}: {report_type}"
+            if view:
+                line += f" view={view}"
+            if title_suffix:
+                line += f" [{title_suffix}]"
+            print(line)
@@ -0,0 +1,162 @@
+"""Rate limited queue for outgoing emails."""
+import queue
+import smtplib
+import threading
+import time
+
+from .config import Config
+from .retry import RetryPolicy
+from .smtppool import SMTP_POOL
+
+
+class TokenBucket:
+    """Token bucket allowing rate operations per second with bursts up to burst."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Wait until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_transient_smtp_error(error):
+    """Determine if sending may succeed when retried."""
+    if isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, OSError)
+
+
+class SendQueue:
+    """Queue of outgoing emails sent by background workers at a limited rate.
+
+    Failed sends are retried with backoff when the error is transient and
+    otherwise recorded in the dead letter list.
+    """
+
+    def __init__(self, workers=None, rate=None, burst=None, max_attempts=None):
+        self._workers = workers or Config.SMTP_POOL_SIZE
+        self._bucket = TokenBucket(rate or Config.EMAIL_RATE, burst or Config.EMAIL_BURST)
+        self._retry = RetryPolicy(max_attempts=max_attempts or Config.EMAIL_SEND_ATTEMPTS)
+        self._queue = queue.Queue(maxsize=Config.EMAIL_QUEUE_SIZE)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.dead_letters = []
+        self._delivered = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._first_submit = None
+        self._last_done = None
+
+    def _start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self._workers):
+                thread = threading.Thread(target=self._work, name=f"email-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, sender, recipients, msg, subject):
+        """Queue a message for sending, blocking while the queue is full."""
+        self._start()
+        submitted = time.monotonic()
+        with self._lock:
+            if self._first_submit is None:
+                self._first_submit = submitted
+        self._queue.put((sender, recipients, msg, subject, submitted))
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                *message, submitted = item
+                self._send(*message)
+                self._record_delivery(submitted, time.monotonic())
+            finally:
+                self._queue.task_done()
+
+    def _record_delivery(self, submitted, done):
+        with self._lock:
+            self._delivered += 1
+            self._latency_total += done - submitted
+            self._latency_max = max(self._latency_max, done - submitted)
+            self._last_done = done
+
+    def get_delivery_stats(self):
+        """Obtain the timings of the messages handled so far, sent or dead lettered.
+
+        Latency runs from submit to the end of the last send attempt, so it
+        includes the time waiting in the queue and on the rate limit.
+        """
+        with self._lock:
+            elapsed = self._last_done - self._first_submit if self._delivered else 0.0
+            return {
+                "items": self._delivered,
+                "elapsed": elapsed,
+                "throughput": self._delivered / elapsed if elapsed else 0.0,
+                "latency_avg": self._latency_total / self._delivered if self._delivered else 0.0,
+                "latency_max": self._latency_max,
+            }
+
+    def _send(self, sender, recipients, msg, subject):
+        attempt = 0
+        while True:
+            self._bucket.acquire()
+            try:
+                SMTP_POOL.sendmail(sender, recipients, msg)
+            except Exception as err:
+                print(f"Sending '{subject}' failed: {err}")
+                if not is_transient_smtp_error(err) or attempt + 1 >= self._retry.max_attempts:
+                    with self._lock:
+                        self.dead_letters.append({"subject": subject, "recipients": recipients, "error": str(err)})
+                    return
+                time.sleep(self._retry.backoff(attempt))
+                attempt += 1
+            else:
+                with self._lock:
+                    self.sent += 1
+                return
+
+    def close(self):
+        """Wait for every queued message to be handled and stop the workers."""
+        with self._lock:
+            threads = list(self._threads)
+            self._threads = []
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+
+    def print_summary(self):
+        print(f"Emails sent={self.sent}, failed={len(self.dead_letters)}")
+        for dead_letter in self.dead_letters:
+            print(
+                f"    Failed to send '{dead_letter['subject']}' to {dead_letter['recipients']}: {dead_letter['error']}"
+            )
+
+
+SEND_QUEUE = SendQueue()
+
+
+def close_send_queue():
+    SEND_QUEUE.close()
+    SEND_QUEUE.print_summary()
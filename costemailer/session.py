@@ -0,0 +1,111 @@
+"""Shared, connection-pooled HTTP session for API access."""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPConnectionPool
+from urllib3 import HTTPSConnectionPool
+
+from .config import Config
+
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+_STATS_LOCK = threading.Lock()
+_STATS = {"requests": 0, "connections_opened": 0, "connections_reused": 0}
+
+
+def _record(stat):
+    with _STATS_LOCK:
+        _STATS[stat] += 1
+
+
+def _record_checkout(conn):
+    # A pooled connection still holding its socket is reused. New connections and pooled ones that were
+    # closed or dropped have no socket and connect again when the request is sent.
+    _record("connections_opened" if conn.sock is None else "connections_reused")
+    return conn
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """HTTP connection pool that counts connections opened and reused by its requests."""
+
+    def _get_conn(self, timeout=None):
+        return _record_checkout(super()._get_conn(timeout=timeout))
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """HTTPS connection pool that counts connections opened and reused by its requests."""
+
+    def _get_conn(self, timeout=None):
+        return _record_checkout(super()._get_conn(timeout=timeout))
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """Transport adapter using the counting connection pools."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+
+class PooledSession(requests.Session):
+    """Session applying the configured default timeouts to every request."""
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = (Config.HTTP_CONNECT_TIMEOUT, Config.HTTP_READ_TIMEOUT)
+        return super().request(method, url, **kwargs)
+
+    def send(self, request, **kwargs):
+        _record("requests")
+        return super().send(request, **kwargs)
+
+
+def create_session():
+    """Create a session with keep-alive connection pooling."""
+    session = PooledSession()
+    adapter = PooledHTTPAdapter(
+        pool_connections=Config.HTTP_POOL_CONNECTIONS, pool_maxsize=Config.HTTP_POOL_MAXSIZE, pool_block=True
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if not Config.HTTP_KEEP_ALIVE:
+        session.headers["Connection"] = "close"
+    return session
+
+
+def get_session():
+    """Obtain the shared session, creating it on first use."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = create_session()
+    return _SESSION
+
+
+def close_session():
+    """Close the shared session and its pooled connections."""
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is not None:
+            _SESSION.close()
+            _SESSION = None
+
+
+def get_connection_stats():
+    """Obtain counts of requests sent, connections opened and live pooled connections reused."""
+    with _STATS_LOCK:
+        return dict(_STATS)
+
+
+def print_connection_stats():
+    stats = get_connection_stats()
+    print(
+        f"HTTP requests={stats['requests']}, connections_opened={stats['connections_opened']},"
+        f" connections_reused={stats['connections_reused']}"
+    )
@@ -0,0 +1,99 @@
+"""Pool of authenticated SMTP connections reused across sends."""
+import queue
+import smtplib
+import threading
+import time
+
+from .config import Config
+
+
+SMTP_HOST = "smtp.gmail.com:587"
+
+
+class SMTPConnectionPool:
+    """Reuse logged-in SMTP connections, reconnecting when one was dropped."""
+
+    def __init__(self, size=None):
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size or Config.SMTP_POOL_SIZE)
+        self._stats_lock = threading.Lock()
+        self._stats = {"sends": 0, "connections_opened": 0, "reconnects": 0, "latency_total": 0.0, "latency_max": 0.0}
+
+    def _connect(self):
+        connection = smtplib.SMTP(SMTP_HOST)
+        connection.starttls()
+        connection.login(Config.EMAIL_USER, Config.EMAIL_PASSWORD)
+        with self._stats_lock:
+            self._stats["connections_opened"] += 1
+        return connection
+
+    @staticmethod
+    def _disconnect(connection):
+        try:
+            connection.quit()
+        except smtplib.SMTPException:
+            connection.close()
+        except OSError:
+            connection.close()
+
+    def _record_send(self, latency):
+        with self._stats_lock:
+            self._stats["sends"] += 1
+            self._stats["latency_total"] += latency
+            self._stats["latency_max"] = max(self._stats["latency_max"], latency)
+
+    def sendmail(self, sender, recipients, msg):
+        """Send the message on a pooled connection."""
+        with self._slots:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                connection = self._connect()
+
+            start = time.monotonic()
+            try:
+                try:
+                    result = connection.sendmail(sender, recipients, msg)
+                except smtplib.SMTPServerDisconnected:
+                    with self._stats_lock:
+                        self._stats["reconnects"] += 1
+                    connection.close()
+                    connection = self._connect()
+                    result = connection.sendmail(sender, recipients, msg)
+            except Exception:
+                self._disconnect(connection)
+                raise
+            self._record_send(time.monotonic() - start)
+            self._idle.put(connection)
+            return result
+
+    def close(self):
+        """Log out of and close every idle connection."""
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._disconnect(connection)
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["latency_avg"] = stats["latency_total"] / stats["sends"] if stats["sends"] else 0.0
+        return stats
+
+
+SMTP_POOL = SMTPConnectionPool()
+
+
+def close_smtp_pool():
+    SMTP_POOL.close()
+
+
+def print_smtp_stats():
+    stats = SMTP_POOL.get_stats()
+    print(
+        f"SMTP sends={stats['sends']}, connections_opened={stats['connections_opened']},"
+        f" reconnects={stats['reconnects']}, latency_avg={stats['latency_avg']:.2f}s,"
+        f" latency_max={stats['latency_max']:.2f}s"
+    )
@@ -0,0 +1,90 @@
+"""Shared Jinja environment compiling each email template once per process."""
+import os
+import threading
+import time
+
+from jinja2 import Environment
+from jinja2 import FileSystemBytecodeCache
+from jinja2 import FileSystemLoader
+
+from . import EMAIL_TEMPLATE_PATH
+from .config import Config
+
+
+RESOURCES_PATH = os.path.join(os.path.dirname(__file__), "resources")
+
+_ENVIRONMENT = {}
+_ENVIRONMENT_LOCK = threading.Lock()
+_STATS_LOCK = threading.Lock()
+_STATS = {"renders": 0, "render_seconds": 0.0, "loads": 0, "load_seconds": 0.0}
+_COMPILED = set()
+
+
+def get_environment():
+    """Obtain the Jinja environment, creating it on first use.
+
+    With TEMPLATE_BYTECODE_CACHE_DIR set compiled templates are also stored
+    on disk, so a cache populated at image build skips parsing entirely.
+    """
+    with _ENVIRONMENT_LOCK:
+        if "env" not in _ENVIRONMENT:
+            bytecode_cache = None
+            if Config.TEMPLATE_BYTECODE_CACHE_DIR:
+                os.makedirs(Config.TEMPLATE_BYTECODE_CACHE_DIR, exist_ok=True)
+                bytecode_cache = FileSystemBytecodeCache(Config.TEMPLATE_BYTECODE_CACHE_DIR)
+            _ENVIRONMENT["env"] = Environment(
+                loader=FileSystemLoader(RESOURCES_PATH),
+                bytecode_cache=bytecode_cache,
+                auto_reload=False,
+            )
+        return _ENVIRONMENT["env"]
+
+
+def get_template(report_type, report_feature="cost"):
+    """Obtain the compiled email template of the report type."""
+    template_name = EMAIL_TEMPLATE_PATH.get(report_feature).get(report_type).name
+    start = time.monotonic()
+    template = get_environment().get_template(template_name)
+    with _STATS_LOCK:
+        _STATS["loads"] += 1
+        _STATS["load_seconds"] += time.monotonic() - start
+        _COMPILED.add(template_name)
+    return template
+
+
+def render_template(report_type, template_variables, report_feature="cost"):
+    """Render the email template of the report type."""
+    template = get_template(report_type, report_feature=report_feature)
+    start = time.monotonic()
+    content = template.render(**template_variables)
+    with _STATS_LOCK:
+        _STATS["renders"] += 1
+        _STATS["render_seconds"] += time.monotonic() - start
+    return content
+
+
+def compile_templates():
+    """Compile every email template, filling the bytecode cache when one is configured."""
+    for report_feature, templates in EMAIL_TEMPLATE_PATH.items():
+        for report_type in templates:
+            get_template(report_type, report_feature=report_feature)
+
+
+def get_template_stats():
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+        stats["compiled"] = len(_COMPILED)
+    return stats
+
+
+def print_template_stats():
+    stats = get_template_stats()
+    print(
+        f"Templates rendered={stats['renders']}, render_seconds={stats['render_seconds']:.3f},"
+        f" loads={stats['loads']}, compiled={stats['compiled']}, load_seconds={stats['load_seconds']:.3f}"
+    )
+
+
+if __name__ == "__main__":
+    compile_templates()
+    print_template_stats()
@@ -0,0 +1,49 @@
+"""Thread-safe cache for bearer tokens with an expiry."""
+import threading
+import time
+
+from .config import Config
+
+
+DEFAULT_TOKEN_TTL = 60
+
+
+class TokenCache:
+    """Cache a bearer token until shortly before it expires.
+
+    The fetch callable returns a tuple of (token, expires_in) where expires_in
+    is the token lifetime in seconds. Concurrent callers wait on a single fetch
+    instead of each requesting a new token.
+    """
+
+    def __init__(self, fetch, refresh_margin=None):
+        self._fetch = fetch
+        self._refresh_margin = Config.TOKEN_REFRESH_MARGIN if refresh_margin is None else refresh_margin
+        self._lock = threading.Lock()
+        self._token = None
+        self._refresh_at = 0
+        self.fetch_count = 0
+
+    def _is_fresh(self):
+        return self._token is not None and time.monotonic() < self._refresh_at
+
+    def get(self):
+        """Obtain a valid token, fetching a new one when needed."""
+        with self._lock:
+            if not self._is_fresh():
+                token, expires_in = self._fetch()
+                self.fetch_count += 1
+                self._token = token
+                if token is None:
+                    self._refresh_at = 0
+                else:
+                    ttl = float(expires_in or DEFAULT_TOKEN_TTL)
+                    margin = min(self._refresh_margin, ttl / 2)
+                    self._refresh_at = time.monotonic() + ttl - margin
+            return self._token
+
+    def invalidate(self):
+        """Discard the cached token so the next call fetches a new one."""
+        with self._lock:
+            self._token = None
+            self._refresh_at = 0
@@ -1,115 +1,148 @@
-from costemailer import costquerier
+import sys
+
 from costemailer import DEFAULT_ACCOUNT_LIMIT
 from costemailer import DEFAULT_ORDER
 from costemailer import DEFAULT_ORG_LEVEL_LIMIT
 from costemailer import DEFAULT_REPORT_ISO_DAYS
 from costemailer import DEFAULT_REPORT_TYPE
-from costemailer import LOGO_PATH
+from costemailer.charting import print_chart_cache_summary
 from costemailer.config import Config
+from costemailer.costquerier import print_query_cache_summary
 from costemailer.rbac import AWS_ACCOUNT_ACCESS
 from costemailer.rbac import AWS_ORG_ACCESS
 from costemailer.rbac import AZURE_SUBSCRIPTION_ID_ACCESS
 from costemailer.rbac import GCP_ACCOUNT_ACCESS
-from costemailer.rbac import get_access
-from costemailer.rbac import get_users
+from costemailer.rbac import get_access_for_users
+from costemailer.rbac import get_recipient_users
 from costemailer.rbac import OPENSHIFT_CLUSTER_ACCESS
 from costemailer.rbac import OPENSHIFT_PROJECT_ACCESS
-from costemailer.reporting.aws import email_report as aws_email_report
-from costemailer.reporting.azure import email_report as azure_email_report
-from costemailer.reporting.gcp import email_report as gcp_email_report
-from costemailer.reporting.ibm import email_report as ibm_email_report
-from costemailer.reporting.openshift import email_report as ocp_email_report
+from costemailer.reporting import aws
+from costemailer.reporting import azure
+from costemailer.reporting import gcp
+from costemailer.reporting import ibm
+from costemailer.reporting import openshift
+from costemailer.reporting import render_message
+from costemailer.reporting import send_message
+from costemailer.retry import print_retry_stats
+from costemailer.runner import Pipeline
+from costemailer.runner import Stage
+from costemailer.schedule import get_scheduled_reports
+from costemailer.schedule import print_plan
+from costemailer.sendqueue import close_send_queue
+from costemailer.sendqueue import SEND_QUEUE
+from costemailer.session import close_session
+from costemailer.session import print_connection_stats
+from costemailer.smtppool import close_smtp_pool
+from costemailer.smtppool import print_smtp_stats
+from costemailer.templating import print_template_stats
 
 
 email_list = []
 print(f"COST_MGMT_RECIPIENTS={Config.COST_MGMT_RECIPIENTS}")
-account_users = get_users()
-print(f"Account has {len(account_users)} users.")
-for user in account_users:
-    username = user.get("username")
-    if username in Config.COST_MGMT_RECIPIENTS.keys():
-        user_email = user.get("email")
-        cc_list = Config.COST_MGMT_RECIPIENTS.get(username, {}).get("cc", [])
-        print(f"User {username} is in recipient list with email {user_email}.")
-        report_type = Config.COST_MGMT_RECIPIENTS.get(username, {}).get("report_type", DEFAULT_REPORT_TYPE)
-        user_access = get_access(
-            username,
-            [
-                AWS_ACCOUNT_ACCESS,
-                AWS_ORG_ACCESS,
-                OPENSHIFT_CLUSTER_ACCESS,
-                OPENSHIFT_PROJECT_ACCESS,
-                AZURE_SUBSCRIPTION_ID_ACCESS,
-                GCP_ACCOUNT_ACCESS,
-            ],
-        )
-        reports_list = Config.COST_MGMT_RECIPIENTS.get(username, {}).get("reports", [])
-        if not reports_list:
-            reports_list.append(Config.COST_MGMT_RECIPIENTS.get(username, {}))
+scheduled_reports = get_scheduled_reports(Config.COST_MGMT_RECIPIENTS)
+print_plan(Config.COST_MGMT_RECIPIENTS, scheduled_reports)
+if Config.RUNTIME_MODE == "plan":
+    sys.exit(0)
+
+# RBAC may return usernames in a different case than configured, key everything by the configured username.
+requested_usernames = {username.lower(): username for username in scheduled_reports}
+recipient_users = {}
+for user in get_recipient_users(list(scheduled_reports.keys())):
+    requested_username = requested_usernames.get(str(user.get("username", "")).lower())
+    if requested_username is not None:
+        recipient_users[requested_username] = user
+for username in scheduled_reports:
+    if username not in recipient_users:
+        print(f"User {username} was not found in RBAC, skipping.")
+
+all_access = get_access_for_users(
+    [user.get("username") for user in recipient_users.values()],
+    [
+        AWS_ACCOUNT_ACCESS,
+        AWS_ORG_ACCESS,
+        OPENSHIFT_CLUSTER_ACCESS,
+        OPENSHIFT_PROJECT_ACCESS,
+        AZURE_SUBSCRIPTION_ID_ACCESS,
+        GCP_ACCOUNT_ACCESS,
+    ],
+)
+recipients_access = {username: all_access.get(user.get("username")) for username, user in recipient_users.items()}
+for username, user in recipient_users.items():
+    user_email = user.get("email")
+    cc_list = Config.COST_MGMT_RECIPIENTS.get(username, {}).get("cc", [])
+    print(f"User {username} is in recipient list with email {user_email}.")
+    report_type = Config.COST_MGMT_RECIPIENTS.get(username, {}).get("report_type", DEFAULT_REPORT_TYPE)
+    user_access = recipients_access.get(username)
+    if user_access is None:
+        print(f"No access found for user {username}, skipping.")
+        continue
+
+    for report in scheduled_reports.get(username, []):
+        report_filter = report.get("filter", {})
+        report_schedule = report.get("schedule", DEFAULT_REPORT_ISO_DAYS)
+        report_view = report.get("view", "ou")
+        report_cc = report.get("cc", [])
+        report_type_item = report.get("report_type", report_type)
+        report_order = report.get("order", DEFAULT_ORDER)
+        report_org_level_limit = report.get("org_level_limit", DEFAULT_ORG_LEVEL_LIMIT)
+        report_account_limit = report.get("account_limit", DEFAULT_ACCOUNT_LIMIT)
+        report_title_suffix = report.get("title_suffix")
+        report_info = {
+            "user": user,
+            "aws.account": user_access[AWS_ACCOUNT_ACCESS],
+            "aws.organizational_unit": user_access[AWS_ORG_ACCESS],
+            "openshift.cluster": user_access[OPENSHIFT_CLUSTER_ACCESS],
+            "openshift.project": user_access[OPENSHIFT_PROJECT_ACCESS],
+            "azure.subscription": user_access[AZURE_SUBSCRIPTION_ID_ACCESS],
+            "gcp.account": user_access[GCP_ACCOUNT_ACCESS],
+            "cc": cc_list + report_cc,
+            "report_type": report_type_item,
+            "filter": report_filter,
+            "schedule": report_schedule,
+            "view": report_view,
+            "order": report_order,
+            "org_level_limit": report_org_level_limit,
+            "account_limit": report_account_limit,
+            "title_suffix": report_title_suffix,
+        }
+        email_list.append(report_info)
+
+REPORT_MODULES = {"AWS": aws, "OCP": openshift, "IBM": ibm, "AZURE": azure, "GCP": gcp}
+
+
+def fetch_report(email_item):
+    report_module = REPORT_MODULES.get(email_item.get("report_type", DEFAULT_REPORT_TYPE))
+    if report_module is None:
+        return []
+    report_data = report_module.fetch_report_data(email_item)
+    if report_data is None:
+        return []
+    return [(email_item, report_data)]
 
-        for report in reports_list:
-            report_filter = report.get("filter", {})
-            report_schedule = report.get("schedule", DEFAULT_REPORT_ISO_DAYS)
-            report_view = report.get("view", "ou")
-            report_cc = report.get("cc", [])
-            report_type_item = report.get("report_type", report_type)
-            report_order = report.get("order", DEFAULT_ORDER)
-            report_org_level_limit = report.get("org_level_limit", DEFAULT_ORG_LEVEL_LIMIT)
-            report_account_limit = report.get("account_limit", DEFAULT_ACCOUNT_LIMIT)
-            report_title_suffix = report.get("title_suffix")
-            report_info = {
-                "user": user,
-                "aws.account": user_access[AWS_ACCOUNT_ACCESS],
-                "aws.organizational_unit": user_access[AWS_ORG_ACCESS],
-                "openshift.cluster": user_access[OPENSHIFT_CLUSTER_ACCESS],
-                "openshift.project": user_access[OPENSHIFT_PROJECT_ACCESS],
-                "azure.subscription": user_access[AZURE_SUBSCRIPTION_ID_ACCESS],
-                "gcp.account": user_access[GCP_ACCOUNT_ACCESS],
-                "cc": cc_list + report_cc,
-                "report_type": report_type_item,
-                "filter": report_filter,
-                "schedule": report_schedule,
-                "view": report_view,
-                "order": report_order,
-                "org_level_limit": report_org_level_limit,
-                "account_limit": report_account_limit,
-                "title_suffix": report_title_suffix,
-            }
-            email_list.append(report_info)
 
-aws_orgs_monthly_params = costquerier.CURRENT_MONTH_PARAMS.copy()
-org_units_response = costquerier.get_cost_data(path=costquerier.AWS_ORG_UNIT_ENDPOINT, params=aws_orgs_monthly_params)
+def aggregate_report(fetched):
+    email_item, report_data = fetched
+    report_module = REPORT_MODULES.get(email_item.get("report_type", DEFAULT_REPORT_TYPE))
+    return report_module.aggregate_report_data(email_item, report_data)
 
-org_units_data = org_units_response.get("data", [])
-org_units = {}
-orgs_in_ou = {}
-aws_accounts_in_ou = {}
-for org in org_units_data:
-    org_unit_id = org.get("org_unit_id")
-    org_units[org_unit_id] = org
-    accounts = org.get("accounts", [])
-    for account in accounts:
-        aws_accounts_in_ou[account] = org_unit_id
 
-for org_unit_id, org in org_units.items():
-    sub_orgs = org.get("sub_orgs", [])
-    for sub_org in sub_orgs:
-        sub_org_dict = org_units.get(sub_org, {})
-        sub_org_dict["parent_org"] = org_unit_id
+pipeline = Pipeline(
+    [
+        Stage("fetch", fetch_report, workers=Config.REPORT_CONCURRENCY),
+        Stage("aggregate", aggregate_report),
+        Stage("render", lambda message: [render_message(message)]),
+        Stage("send", send_message, delivery=SEND_QUEUE),
+    ]
+)
+pipeline.run(email_list)
+close_send_queue()
+pipeline.print_stats()
+print_template_stats()
+print_chart_cache_summary()
 
-for email_item in email_list:  # noqa C901
-    images = []
-    img_paths = [str(LOGO_PATH)]
-    report_type = email_item.get("report_type", DEFAULT_REPORT_TYPE)
-    if report_type == "AWS":
-        aws_email_report(email_item, images, img_paths, aws_accounts_in_ou=aws_accounts_in_ou, org_units=org_units)
-    elif report_type == "OCP":
-        ocp_email_report(email_item, images, img_paths)
-    elif report_type == "IBM":
-        ibm_email_report(email_item, images, img_paths)
-    elif report_type == "AZURE":
-        azure_email_report(email_item, images, img_paths)
-    elif report_type == "GCP":
-        gcp_email_report(email_item, images, img_paths)
-    else:
-        pass
+print_query_cache_summary()
+print_connection_stats()
+print_retry_stats()
+print_smtp_stats()
+close_smtp_pool()
+close_session()